@@ -0,0 +1,93 @@
+import sys
+import json
+import random
+import argparse
+import platform
+import statistics
+import tracemalloc
+from time import perf_counter
+from rpg.dungeon import _Generator
+
+PHASES = ("rooms", "caves", "connect_caves", "copy_rooms", "connect_rooms", "connect_portals", "clean_up")
+
+
+def run_one(width: int, height: int, seed: int, memory: bool) -> dict:
+    if memory:
+        tracemalloc.start()
+    try:
+        generator = _Generator(width, height, rng=random.Random(seed))
+        start = perf_counter()
+        generator.run()
+        total = perf_counter() - start
+    finally:
+        if memory:
+            tracemalloc.stop()
+    return {"width": width, "height": height, "seed": seed, "total": total, "phases": generator.stats()}
+
+
+def summarize(runs: list) -> dict:
+    summary = dict()
+    for phase in PHASES + ("total",):
+        if phase == "total":
+            times = [run["total"] for run in runs]
+            expanded, memory = [], []
+        else:
+            times = [run["phases"][phase]["time"] for run in runs]
+            expanded = [run["phases"][phase]["expanded"] for run in runs]
+            memory = [run["phases"][phase]["peak_memory"] for run in runs
+                      if run["phases"][phase]["peak_memory"] is not None]
+        summary[phase] = {
+            "time_mean": statistics.mean(times),
+            "time_median": statistics.median(times),
+            "time_max": max(times),
+            "expanded_mean": statistics.mean(expanded) if expanded else 0,
+            "peak_memory_max": max(memory) if memory else None,
+        }
+    return summary
+
+
+def print_summary(width: int, height: int, summary: dict) -> None:
+    print("{}x{}".format(width, height))
+    print("  {:<14} {:>10} {:>10} {:>10} {:>12} {:>12}".format(
+        "phase", "mean ms", "median ms", "max ms", "expanded", "peak KiB"))
+    for phase, values in summary.items():
+        peak = values["peak_memory_max"]
+        print("  {:<14} {:>10.2f} {:>10.2f} {:>10.2f} {:>12.0f} {:>12}".format(
+            phase,
+            values["time_mean"] * 1000.0,
+            values["time_median"] * 1000.0,
+            values["time_max"] * 1000.0,
+            values["expanded_mean"],
+            "-" if peak is None else "{:.0f}".format(peak / 1024.0)
+        ))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Per-phase benchmark of dungeon generation")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64, 128, 256], help="square map sizes")
+    parser.add_argument("--seeds", type=int, default=5, help="number of seeded dungeons per size")
+    parser.add_argument("--first-seed", type=int, default=0)
+    parser.add_argument("--memory", action="store_true", help="trace peak memory (slows generation down)")
+    parser.add_argument("--output", help="write machine-readable results to this JSON file")
+    args = parser.parse_args()
+
+    results = {
+        "python": platform.python_version(),
+        "seeds": list(range(args.first_seed, args.first_seed + args.seeds)),
+        "generator": repr(_Generator.constants()),
+        "sizes": [],
+    }
+    for size in args.sizes:
+        runs = [run_one(size, size, seed, args.memory) for seed in results["seeds"]]
+        summary = summarize(runs)
+        print_summary(size, size, summary)
+        results["sizes"].append({"width": size, "height": size, "summary": summary, "runs": runs})
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+import sys
+import json
+import random
+import argparse
+import platform
+import statistics
+from time import perf_counter
+from rpg.dungeon import Dungeon, PathFinder, JumpPointFinder, PathNotFoundError
+
+FINDERS = ("astar", "jps", "hpa")
+
+
+class RouteFinder:
+    # solves on the region graph and refines the first segment only, like a walking monster would
+
+    def __init__(self, dungeon: Dungeon) -> None:
+        self._dungeon = dungeon
+
+    def expanded(self) -> int:
+        # abstract nodes of the route plus the cluster cells searched to link its ends and refine the segment
+        return self._dungeon.regions().expanded()
+
+    def find(self, start: tuple, goal: tuple, allowed: tuple) -> list:
+        return self._dungeon.next_segment(start, goal)
+
+
+def find(finder, start: tuple, goal: tuple) -> tuple:
+    before = finder.expanded()
+    began = perf_counter()
+    try:
+        length = len(finder.find(start, goal, Dungeon.MOVEMENT_ALLOWED))
+    except PathNotFoundError:
+        length = 0
+    return perf_counter() - began, finder.expanded() - before, length
+
+
+def run_one(size: int, seed: int, pairs: int) -> dict:
+    dungeon = Dungeon(size, size, seed=seed)
+    tiles = dungeon.tiles()
+    allowed = set(Dungeon.MOVEMENT_ALLOWED)
+    cells = [(index % size, index // size) for index, tile in enumerate(tiles.raw()) if tile in allowed]
+    rng = random.Random(seed)
+    # the weighted A* of the generator with a zero cost field is 4-connected, jump point search is 8-connected
+    finders = {
+        "astar": PathFinder(tiles, lambda point: 0),
+        "jps": JumpPointFinder(tiles),
+        "hpa": RouteFinder(dungeon),
+    }
+    # the region graph is built once per map, it is not part of the query time
+    began = perf_counter()
+    portals = dungeon.regions().portal_count()
+    build = perf_counter() - began
+    runs = {name: [] for name in FINDERS}
+    for _ in range(pairs):
+        start, goal = rng.choice(cells), rng.choice(cells)
+        for name in FINDERS:
+            runs[name].append(find(finders[name], start, goal))
+    return {"size": size, "seed": seed, "runs": runs, "portals": portals, "graph_build": build}
+
+
+def summarize(results: list) -> dict:
+    summary = dict()
+    for name in FINDERS:
+        runs = [run for result in results for run in result["runs"][name]]
+        times = [run[0] for run in runs]
+        summary[name] = {
+            "time_mean": statistics.mean(times),
+            "time_median": statistics.median(times),
+            "time_max": max(times),
+            "expanded_mean": statistics.mean(run[1] for run in runs),
+            "found": sum(1 for run in runs if run[2]),
+        }
+    return summary
+
+
+def print_summary(size: int, summary: dict) -> None:
+    print("{}x{}".format(size, size))
+    print("  {:<8} {:>10} {:>10} {:>10} {:>12} {:>8}".format(
+        "finder", "mean ms", "median ms", "max ms", "expanded", "found"))
+    for name, values in summary.items():
+        print("  {:<8} {:>10.2f} {:>10.2f} {:>10.2f} {:>12.0f} {:>8}".format(
+            name,
+            values["time_mean"] * 1000.0,
+            values["time_median"] * 1000.0,
+            values["time_max"] * 1000.0,
+            values["expanded_mean"],
+            values["found"]
+        ))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Path finders compared on generated dungeons")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256], help="square map sizes")
+    parser.add_argument("--seeds", type=int, default=3, help="number of seeded dungeons per size")
+    parser.add_argument("--first-seed", type=int, default=0)
+    parser.add_argument("--pairs", type=int, default=50, help="random start and goal pairs per dungeon")
+    parser.add_argument("--output", help="write machine-readable results to this JSON file")
+    args = parser.parse_args()
+
+    results = {
+        "python": platform.python_version(),
+        "seeds": list(range(args.first_seed, args.first_seed + args.seeds)),
+        "pairs": args.pairs,
+        "sizes": [],
+    }
+    for size in args.sizes:
+        runs = [run_one(size, seed, args.pairs) for seed in results["seeds"]]
+        summary = summarize(runs)
+        print_summary(size, summary)
+        print("  region graph: {:.0f} portals built in {:.2f} ms".format(
+            statistics.mean(run["portals"] for run in runs),
+            statistics.mean(run["graph_build"] for run in runs) * 1000.0
+        ))
+        results["sizes"].append({"width": size, "height": size, "summary": summary, "runs": runs})
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+import os
+import sys
+import json
+import argparse
+import platform
+import statistics
+import subprocess
+
+# modules that generation workers, benchmarks and tools import, none of them may load pygame or the art
+CORE_MODULES = (
+    "rpg.utils", "rpg.entities", "rpg.dungeon", "rpg.dungeon_file", "rpg.dungeon_cache",
+    "rpg.world", "rpg.levels", "rpg.obj_hero",
+)
+# the presentation layer loads pygame but not the sprite sheet
+SCENE_MODULES = ("rpg.scene", "rpg.scene_game", "rpg.rogue")
+
+PROBE = """
+import sys
+from time import perf_counter
+began = perf_counter()
+import {module}
+elapsed = perf_counter() - began
+scene = sys.modules.get("rpg.scene")
+print(elapsed, "pygame" in sys.modules, scene is not None and scene.SpriteSheet._image is not None)
+"""
+
+
+def probe(module: str, cwd: str) -> tuple:
+    # a fresh interpreter per run, so nothing is already imported
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)), SDL_VIDEODRIVER="dummy",
+               PYGAME_HIDE_SUPPORT_PROMPT="1")
+    output = subprocess.run([sys.executable, "-c", PROBE.format(module=module)], cwd=cwd, env=env,
+                            capture_output=True, text=True, check=True).stdout.split()
+    return float(output[0]), output[1] == "True", output[2] == "True"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Import time of the game modules in a fresh interpreter")
+    parser.add_argument("--runs", type=int, default=5, help="interpreters started per module")
+    parser.add_argument("--budget", type=float, default=100.0, help="median import time limit of a core module, ms")
+    parser.add_argument("--check", action="store_true",
+                        help="exit with 1 when a core module loads pygame or exceeds the budget, "
+                             "or a scene module loads the art")
+    parser.add_argument("--output", help="write machine-readable results to this JSON file")
+    args = parser.parse_args()
+
+    # imports must not depend on the working directory, so they run from an unrelated one
+    cwd = os.path.abspath(os.sep)
+    results = {"python": platform.python_version(), "runs": args.runs, "modules": dict()}
+    failed = list()
+    print("  {:<20} {:>10} {:>10} {:>8} {:>8}".format("module", "median ms", "max ms", "pygame", "art"))
+    for module in CORE_MODULES + SCENE_MODULES:
+        runs = [probe(module, cwd) for _ in range(args.runs)]
+        times = [run[0] * 1000.0 for run in runs]
+        pygame, art = runs[0][1], runs[0][2]
+        results["modules"][module] = {"times_ms": times, "pygame": pygame, "art": art}
+        print("  {:<20} {:>10.1f} {:>10.1f} {:>8} {:>8}".format(
+            module, statistics.median(times), max(times), "yes" if pygame else "no", "yes" if art else "no"))
+        if module in CORE_MODULES:
+            if pygame:
+                failed.append("{} loads pygame".format(module))
+            if statistics.median(times) > args.budget:
+                failed.append("{} takes {:.1f} ms".format(module, statistics.median(times)))
+        if art:
+            failed.append("{} loads the sprite sheet".format(module))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+    if args.check:
+        for reason in failed:
+            print("regression: {}".format(reason))
+        return 1 if failed else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
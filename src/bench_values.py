@@ -0,0 +1,176 @@
+import sys
+import json
+import random
+import argparse
+import platform
+import tracemalloc
+from math import isqrt
+from time import perf_counter
+from typing import Any, Callable
+from rpg.dungeon import Room
+from rpg.utils import Point
+
+
+class LegacyPoint:
+    # the dict backed point with property accessors the slotted one replaced, kept as the baseline
+
+    def __init__(self, x: int = 0, y: int = 0):
+        self._x = x
+        self._y = y
+
+    @property
+    def x(self) -> int:
+        return self._x
+
+    @property
+    def y(self) -> int:
+        return self._y
+
+    def distance(self, x: int, y: int) -> int:
+        return isqrt((self._x - x) ** 2 + (self._y - y) ** 2)
+
+    def __eq__(self, other: Any) -> bool:
+        if type(other) is not LegacyPoint:
+            return False
+        return other.x == self.x and other.y == self.y
+
+    def __hash__(self) -> int:
+        return self._x * 1_000_000 + self._y
+
+
+class LegacyRoom:
+
+    def __init__(self, x: int, y: int, width: int, height: int):
+        self._x = x
+        self._y = y
+        self._width = width
+        self._height = height
+
+
+def measure(make: Callable[[int, int], Any], coordinates: list) -> dict:
+    tracemalloc.start()
+    began = perf_counter()
+    values = [make(x, y) for x, y in coordinates]
+    create = perf_counter() - began
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    began = perf_counter()
+    unique = set(values)
+    hashing = perf_counter() - began
+    probes = [make(x, y) for x, y in coordinates[::10]]
+    began = perf_counter()
+    found = sum(1 for value in probes if value in unique)
+    lookup = perf_counter() - began
+    began = perf_counter()
+    total = 0
+    for value in values:
+        total += value.x + value.y
+    access = perf_counter() - began
+    return {
+        "bytes_per_instance": memory / len(coordinates),
+        "create_ms": create * 1000.0,
+        "hash_ms": hashing * 1000.0,
+        "lookup_ms": lookup * 1000.0,
+        "access_ms": access * 1000.0,
+        "found": found,
+    }
+
+
+def measure_packed(coordinates: list) -> dict:
+    # packed ints as dict keys instead of point objects
+    tracemalloc.start()
+    began = perf_counter()
+    keys = [Point.pack(x, y) for x, y in coordinates]
+    create = perf_counter() - began
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    began = perf_counter()
+    unique = set(keys)
+    hashing = perf_counter() - began
+    probes = [Point.pack(x, y) for x, y in coordinates[::10]]
+    began = perf_counter()
+    found = sum(1 for key in probes if key in unique)
+    lookup = perf_counter() - began
+    began = perf_counter()
+    total = 0
+    for key in keys:
+        point = Point.unpack(key)
+        total += point.x + point.y
+    access = perf_counter() - began
+    return {
+        "bytes_per_instance": memory / len(coordinates),
+        "create_ms": create * 1000.0,
+        "hash_ms": hashing * 1000.0,
+        "lookup_ms": lookup * 1000.0,
+        "access_ms": access * 1000.0,
+        "found": found,
+    }
+
+
+def measure_rooms(make: Callable[[int, int, int, int], Any], count: int, rng: random.Random) -> dict:
+    shapes = [(rng.randrange(4096), rng.randrange(4096), rng.randrange(4, 16), rng.randrange(4, 16))
+              for _ in range(count)]
+    tracemalloc.start()
+    began = perf_counter()
+    rooms = [make(*shape) for shape in shapes]
+    create = perf_counter() - began
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del rooms
+    return {"bytes_per_instance": memory / count, "create_ms": create * 1000.0}
+
+
+def print_table(title: str, rows: dict, columns: tuple) -> None:
+    print(title)
+    print("  {:<8}".format("type") + "".join(" {:>12}".format(column) for column in columns))
+    for name, values in rows.items():
+        print("  {:<8}".format(name) + "".join(" {:>12.1f}".format(values[column]) for column in columns))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Memory and speed of the coordinate value types")
+    parser.add_argument("--count", type=int, default=100_000, help="instances per type")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check", action="store_true",
+                        help="exit with 1 when the slotted types are not smaller and faster than the legacy ones")
+    parser.add_argument("--output", help="write machine-readable results to this JSON file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    coordinates = [(rng.randrange(-4096, 4096), rng.randrange(-4096, 4096)) for _ in range(args.count)]
+    points = {
+        "legacy": measure(LegacyPoint, coordinates),
+        "point": measure(Point, coordinates),
+        "packed": measure_packed(coordinates),
+    }
+    rooms = {
+        "legacy": measure_rooms(LegacyRoom, args.count, random.Random(args.seed)),
+        "room": measure_rooms(Room, args.count, random.Random(args.seed)),
+    }
+    print_table("{} points".format(args.count), points,
+                ("bytes_per_instance", "create_ms", "hash_ms", "lookup_ms", "access_ms"))
+    print_table("{} rooms".format(args.count), rooms, ("bytes_per_instance", "create_ms"))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"python": platform.python_version(), "count": args.count, "seed": args.seed,
+                       "points": points, "rooms": rooms}, file, indent=2, sort_keys=True)
+    if args.check:
+        legacy, point = points["legacy"], points["point"]
+        failed = [
+            name for name, passed in (
+                ("point memory", point["bytes_per_instance"] < legacy["bytes_per_instance"]),
+                ("point hashing", point["hash_ms"] < legacy["hash_ms"]),
+                ("point lookup", point["lookup_ms"] < legacy["lookup_ms"]),
+                ("packed memory", points["packed"]["bytes_per_instance"] < point["bytes_per_instance"]),
+                ("room memory", rooms["room"]["bytes_per_instance"] < rooms["legacy"]["bytes_per_instance"]),
+            ) if not passed
+        ]
+        for name in failed:
+            print("regression: {}".format(name))
+        return 1 if failed else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
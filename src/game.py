@@ -1,8 +1,14 @@
 import pygame
 from rpg.rogue import RPG
+from rpg.scheduler import FixedStepScheduler
 
 SURFACE_SIZE = (800, 600)
 DUNGEON_SIZE = (255, 255)
+# game ticks per second, movement speed depends on it
+TICK_RATE = 10
+# frames per second, 0 waits for vsync instead (uncapped where the display cannot sync)
+RENDER_RATE = 60
+MAX_FRAME_SKIP = 5
 
 
 def main():
@@ -11,18 +17,34 @@ def main():
 
     game = RPG(*SURFACE_SIZE)
 
-    surface = pygame.display.set_mode(SURFACE_SIZE)
+    surface = None
+    if RENDER_RATE == 0:
+        # pygame only honours vsync for scaled or OpenGL displays
+        try:
+            surface = pygame.display.set_mode(SURFACE_SIZE, pygame.SCALED, vsync=1)
+        except pygame.error:
+            pass
+    if surface is None:
+        surface = pygame.display.set_mode(SURFACE_SIZE)
     pygame.display.set_caption("Rogue like RPG")
 
+    scheduler = FixedStepScheduler(TICK_RATE, RENDER_RATE, MAX_FRAME_SKIP)
     run = True
-    while run:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                run = False
-        game.update()
-        surface.fill((0, 0, 0))
-        game.render(surface)
-        pygame.display.update()
+    try:
+        while run:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    run = False
+            for _ in range(scheduler.ticks()):
+                game.update()
+            dirty = game.render(surface)
+            if dirty is None:
+                pygame.display.update()
+            elif dirty:
+                pygame.display.update(dirty)
+            scheduler.wait_frame()
+    finally:
+        game.shutdown()
 
 
 if __name__ == '__main__':
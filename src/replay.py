@@ -0,0 +1,133 @@
+import os
+import sys
+import json
+import random
+import argparse
+import statistics
+from time import perf_counter
+
+# must be set before pygame initializes its video subsystem
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame  # noqa: E402
+from rpg.dungeon import Dungeon  # noqa: E402
+from rpg.dungeon_file import DungeonFile  # noqa: E402
+from rpg.scene_game import SceneGame  # noqa: E402
+
+SURFACE_SIZE = (800, 600)
+DUNGEON_SIZE = (256, 256)
+
+MOVES = {
+    ".": (0, 0),
+    "L": (-1, 0),
+    "R": (1, 0),
+    "U": (0, -1),
+    "D": (0, 1),
+    "UL": (-1, -1),
+    "UR": (1, -1),
+    "DL": (-1, 1),
+    "DR": (1, 1),
+}
+
+
+def load_script(path: str) -> list:
+    # one move per line, optionally followed by a repeat count: "R 10"
+    script = list()
+    with open(path) as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.split("#", 1)[0].split()
+            if not line:
+                continue
+            if line[0] not in MOVES:
+                raise ValueError("Unknown move '{}' at line {}".format(line[0], line_number))
+            count = int(line[1]) if len(line) > 1 else 1
+            script.extend([line[0]] * count)
+    return script
+
+
+def random_script(frames: int, seed: int) -> list:
+    # a wandering walk: keep a direction for a while, sometimes stand still
+    rng = random.Random(seed)
+    script = list()
+    while len(script) < frames:
+        script.extend([rng.choice(list(MOVES))] * rng.randrange(1, 12))
+    return script[:frames]
+
+
+def percentiles(samples: list) -> dict:
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {
+        "p50": cuts[49] * 1000.0,
+        "p95": cuts[94] * 1000.0,
+        "p99": cuts[98] * 1000.0,
+        "max": max(samples) * 1000.0,
+    }
+
+
+def replay(dungeon: Dungeon, script: list, warmup: int) -> dict:
+    surface = pygame.display.set_mode(SURFACE_SIZE)
+    frames = iter(script)
+    scene = SceneGame(dungeon, *SURFACE_SIZE, controls=lambda: MOVES[next(frames)])
+    update_times, render_times = list(), list()
+    for frame in range(len(script)):
+        start = perf_counter()
+        scene.update()
+        updated = perf_counter()
+        dirty = scene.render(surface)
+        if dirty is None:
+            pygame.display.update()
+        elif dirty:
+            pygame.display.update(dirty)
+        rendered = perf_counter()
+        if frame >= warmup:
+            update_times.append(updated - start)
+            render_times.append(rendered - updated)
+    return {
+        "frames": len(update_times),
+        "update_ms": percentiles(update_times),
+        "render_ms": percentiles(render_times),
+        "frame_ms": percentiles([u + r for u, r in zip(update_times, render_times)]),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Headless replay of SceneGame for frame-time profiling")
+    parser.add_argument("--seed", type=int, default=0, help="dungeon seed")
+    parser.add_argument("--load", help="replay on a saved dungeon file instead of a seeded one")
+    parser.add_argument("--script", help="input script, one move ({}) per line".format(" ".join(MOVES)))
+    parser.add_argument("--frames", type=int, default=1000, help="length of the random script")
+    parser.add_argument("--script-seed", type=int, default=0)
+    parser.add_argument("--save-script", help="write the replayed moves to this file")
+    parser.add_argument("--warmup", type=int, default=10, help="frames left out of the statistics")
+    parser.add_argument("--output", help="write machine-readable results to this JSON file")
+    args = parser.parse_args()
+
+    pygame.init()
+    try:
+        if args.load:
+            dungeon = DungeonFile.load(args.load)
+        else:
+            dungeon = Dungeon(*DUNGEON_SIZE, seed=args.seed)
+        script = load_script(args.script) if args.script else random_script(args.frames, args.script_seed)
+        if len(script) <= args.warmup + 1:
+            parser.error("script is too short for the warmup")
+        if args.save_script:
+            with open(args.save_script, "w") as file:
+                file.writelines(move + "\n" for move in script)
+        results = replay(dungeon, script, args.warmup)
+    finally:
+        pygame.quit()
+
+    for name in ("update_ms", "render_ms", "frame_ms"):
+        values = results[name]
+        print("{:<10} p50 {:8.3f}  p95 {:8.3f}  p99 {:8.3f}  max {:8.3f}".format(
+            name, values["p50"], values["p95"], values["p99"], values["max"]))
+    if args.output:
+        results.update({"seed": args.seed, "load": args.load, "script": args.script})
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,213 @@
+from __future__ import annotations
+from array import array
+from heapq import heapify, heappush as push, heappop as pop
+from typing import Iterable
+from rpg.utils import Grid, GridWatcher
+
+
+class DijkstraMap(GridWatcher):
+    # one distance field shared by all monsters: every cell holds the number of steps to the nearest goal,
+    # so a monster chooses its step by comparing the values of its eight neighbours
+    UNREACHED = 1 << 30
+    # flee maps scale an approach map by a factor below -1 and rescan it,
+    # so fleeing monsters prefer distant exits to the nearest dead end
+    FLEE_COEFFICIENT = -1.2
+
+    def __init__(self, grid: Grid, passable: Iterable[int], limit: int = None) -> None:
+        self._grid = grid
+        self._passable_tiles = tuple(passable)
+        self._passable = Grid.lookup_table(dict.fromkeys(self._passable_tiles, True), False)
+        # cells with a greater value stay unreached, this bounds the cost of every update
+        self._limit = limit if limit is not None else DijkstraMap.UNREACHED - 1
+        self._size = grid.width() * grid.height()
+        self._field = array('l', [DijkstraMap.UNREACHED]) * self._size
+        self._goals = dict()
+        self._links = dict()
+        self._version = 0
+
+    def attach(self) -> DijkstraMap:
+        self._grid.watch(self)
+        return self
+
+    def detach(self) -> None:
+        self._grid.unwatch(self)
+
+    def changed(self, left: int, top: int, right: int, bottom: int) -> None:
+        # a changed tile alters the links of its 3x3 neighbourhood, distances may change anywhere
+        width = self._grid.width()
+        for y in range(max(top - 1, 0), min(bottom + 1, self._grid.height())):
+            for x in range(max(left - 1, 0), min(right + 1, width)):
+                self._links.pop(y * width + x, None)
+        self.rebuild()
+
+    def _neighbours(self, index: int) -> tuple:
+        # passable cells around a cell, computed on first use; terrain changes drop them in changed()
+        links = self._links.get(index)
+        if links is None:
+            width, height = self._grid.width(), self._grid.height()
+            data = self._grid.raw()
+            passable = self._passable
+            x, y = index % width, index // width
+            links = tuple(
+                ny * width + nx
+                for ny in range(max(y - 1, 0), min(y + 2, height))
+                for nx in range(max(x - 1, 0), min(x + 2, width))
+                if (nx != x or ny != y) and passable[data[ny * width + nx]]
+            )
+            self._links[index] = links
+        return links
+
+    def _lower(self, entries: list) -> None:
+        # entries are packed as value * size + index like the open set of PathFinder; values only decrease here
+        size = self._size
+        field = self._field
+        limit = self._limit
+        heapify(entries)
+        while entries:
+            entry = pop(entries)
+            index, value = entry % size, entry // size
+            if value != field[index]:
+                continue
+            value += 1
+            if value > limit:
+                continue
+            for neighbour in self._neighbours(index):
+                if value < field[neighbour]:
+                    field[neighbour] = value
+                    push(entries, value * size + neighbour)
+
+    def _raise(self, cells: Iterable[int]) -> list:
+        # invalidates the cells whose value depended on the given ones and returns the entries to rescan them;
+        # cells are visited by increasing value, so every cell knows whether its supporters were invalidated
+        size = self._size
+        field = self._field
+        goals = self._goals
+        unreached = DijkstraMap.UNREACHED
+        starts = set(cells)
+        heap = [field[index] * size + index for index in starts if field[index] != unreached]
+        heapify(heap)
+        invalid = set()
+        while heap:
+            entry = pop(heap)
+            index, value = entry % size, entry // size
+            if index in invalid or value != field[index]:
+                continue
+            neighbours = self._neighbours(index)
+            if index not in starts:
+                if goals.get(index) == value:
+                    continue
+                if any(field[n] == value - 1 and n not in invalid for n in neighbours):
+                    continue
+            invalid.add(index)
+            for neighbour in neighbours:
+                if field[neighbour] == value + 1:
+                    push(heap, (value + 1) * size + neighbour)
+        for index in invalid:
+            field[index] = unreached
+        entries = list()
+        limit = self._limit
+        for index in invalid:
+            best = goals.get(index, unreached)
+            for neighbour in self._neighbours(index):
+                if field[neighbour] + 1 < best:
+                    best = field[neighbour] + 1
+            if best <= limit:
+                field[index] = best
+                entries.append(best * size + index)
+        return entries
+
+    def rebuild(self) -> None:
+        size = self._size
+        field = self._field
+        field[:] = array('l', [DijkstraMap.UNREACHED]) * size
+        for index, value in self._goals.items():
+            field[index] = value
+        self._lower([value * size + index for index, value in self._goals.items()])
+        self._version += 1
+
+    def set_goals(self, goals: dict) -> None:
+        # goals map (x, y) to their own value, lower values attract more; impassable goals are ignored.
+        # Only cells affected by the difference with the previous goals are updated
+        width = self._grid.width()
+        data = self._grid.raw()
+        passable = self._passable
+        goals = {
+            y * width + x: value for (x, y), value in goals.items() if passable[data[y * width + x]]
+        }
+        previous = self._goals
+        if goals == previous:
+            return
+        unreached = DijkstraMap.UNREACHED
+        raised = [index for index, value in previous.items() if goals.get(index, unreached) > value]
+        self._goals = goals
+        # the new goals are lowered in first: the cells that end up closer to them no longer depend on
+        # the raised goals, so a moving goal only repairs the cells on its far side
+        size = self._size
+        field = self._field
+        entries = list()
+        for index, value in goals.items():
+            if value < field[index]:
+                field[index] = value
+                entries.append(value * size + index)
+        self._lower(entries)
+        if raised:
+            self._lower(self._raise(raised))
+        self._version += 1
+
+    def set_goal(self, x: int, y: int, value: int = 0) -> None:
+        self.set_goals({(x, y): value})
+
+    def flee_goals(self, coefficient: float = FLEE_COEFFICIENT) -> dict:
+        # goals of the flee map: every reached cell with its scaled value; with a limit only the cells
+        # around the goals can be reached, so the rest of the field is not scanned
+        width, height = self._grid.width(), self._grid.height()
+        field = self._field
+        unreached = DijkstraMap.UNREACHED
+        left, top, right, bottom = 0, 0, width, height
+        if self._goals and self._limit != unreached - 1:
+            reach = max(self._limit - min(self._goals.values()), 0)
+            columns = [index % width for index in self._goals]
+            rows = [index // width for index in self._goals]
+            left, right = max(min(columns) - reach, 0), min(max(columns) + reach + 1, width)
+            top, bottom = max(min(rows) - reach, 0), min(max(rows) + reach + 1, height)
+        goals = dict()
+        for y in range(top, bottom):
+            offset = y * width
+            for x in range(left, right):
+                value = field[offset + x]
+                if value != unreached:
+                    goals[(x, y)] = int(value * coefficient)
+        return goals
+
+    def flee(self, coefficient: float = FLEE_COEFFICIENT, limit: int = 0) -> DijkstraMap:
+        # the flee map only covers cells around the goals of this map up to the limit
+        result = DijkstraMap(self._grid, self._passable_tiles, limit)
+        result.set_goals(self.flee_goals(coefficient))
+        return result
+
+    def steps(self, x: int, y: int) -> list:
+        # (value, dx, dy) of the neighbours lower than the cell, best first; empty when the cell is a local minimum
+        width = self._grid.width()
+        field = self._field
+        index = y * width + x
+        current = field[index]
+        return sorted(
+            (field[neighbour], neighbour % width - x, neighbour // width - y)
+            for neighbour in self._neighbours(index)
+            if field[neighbour] < current
+        )
+
+    def raw(self) -> array:
+        return self._field
+
+    def get(self, x: int, y: int) -> int:
+        return self._field[y * self._grid.width() + x]
+
+    def is_reached(self, x: int, y: int) -> bool:
+        return self.get(x, y) != DijkstraMap.UNREACHED
+
+    def version(self) -> int:
+        return self._version
+
+    def __call__(self, point: tuple) -> int:
+        return self.get(*point)
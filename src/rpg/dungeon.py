@@ -1,77 +1,252 @@
 from __future__ import annotations
 import random
-from typing import Callable
+import tracemalloc
+from array import array
+from math import isqrt
+from typing import Callable, Iterable, Iterator, Optional, Union
 from heapq import heappush as push, heappop as pop
+from queue import Queue
+from time import perf_counter
 
 from rpg.obj_loot import Loot
 from rpg.obj_monsters import Monster
-from rpg.utils import Point, Grid, Rect
+from rpg.dijkstra import DijkstraMap
+from rpg.regions import RegionGraph
+from rpg.utils import Point, Grid, GridWatcher, BitGrid, Rect, CostField
+from rpg.entities import EntityStore
 
 
 class PathNotFoundError(RuntimeError):
     pass
 
 
-class PathFinder:
-
-    class PriorityQueue:
-
-        class Item:
-
-            def __init__(self, point: tuple, priority: int):
-                self.point = point
-                self.priority = priority
-
-            def __lt__(self, other: PathFinder.PriorityQueue.Item):
-                return self.priority < other.priority
-
-        def __init__(self):
-            self.items = []
-
-        def is_empty(self) -> bool:
-            return len(self.items) == 0
+class RoomPlacementError(RuntimeError):
+    pass
 
-        def put(self, point: tuple, priority: int) -> None:
-            push(self.items, PathFinder.PriorityQueue.Item(point, priority))
 
-        def get(self) -> tuple:
-            return pop(self.items).point
+class PathFinder:
+    # 1.0 gives optimal paths, greater values trade path quality for fewer expanded nodes
+    DEFAULT_WEIGHT = 1.0
 
-    def __init__(self, grid: Grid, cost: Callable[[tuple], int]):
+    def __init__(self, grid: Grid, cost: Union[CostField, Callable[[tuple], int]], weight: float = DEFAULT_WEIGHT):
+        if weight < 1.0:
+            raise ValueError("Heuristic weight cannot be lesser than 1")
         self._data = grid
         self._cost_callable = cost
+        self._cost_field = cost.raw() if isinstance(cost, CostField) else None
+        self._weight = weight
+        self._expanded = 0
 
-    def cost(self, point_to: tuple, point_goal: tuple) -> int:
-        dist = Point.dst(*point_to, *point_goal)
-        return dist + self._cost_callable(point_to)
+    def cost(self, point_to: tuple) -> int:
+        # every step costs at least 1, so manhattan distance stays admissible
+        return 1 + self._cost_callable(point_to)
+
+    def expanded(self) -> int:
+        return self._expanded
 
     def find(self, start: tuple, goal: tuple, allowed: set) -> list:
-        frontier = PathFinder.PriorityQueue()
-        frontier.put(start, 0)
-        came_from = dict()
-        came_from[start] = None
-        cost_so_far = dict()
-        cost_so_far[start] = 1
-        while not frontier.is_empty():
-            current = frontier.get()
+        width, height = self._data.width(), self._data.height()
+        if not self._data.in_bounds(*start) or not self._data.in_bounds(*goal):
+            raise PathNotFoundError("Path not found")
+        size = width * height
+        data = self._data.raw()
+        field = self._cost_field
+        weight = self._weight
+        goal_x, goal_y = goal
+        start_index = start[1] * width + start[0]
+        goal_index = goal_y * width + goal_x
+        # open set entries are packed as f * size + index, so the heap holds plain ints
+        frontier = [start_index]
+        came_from = {start_index: -1}
+        cost_so_far = {start_index: 0}
+        closed = set()
+        while frontier:
+            current = pop(frontier) % size
+            if current in closed:
+                continue
             # check if goal is reached
-            if current == goal:
+            if current == goal_index:
                 path = list()
                 path.append(start)
-                while current != start:
-                    path.append(current)
+                while current != start_index:
+                    path.append((current % width, current // width))
                     current = came_from[current]
                 return path
-            for _next in self._data.neighbours(*current, allowed=allowed):
-                new_cost = cost_so_far[current] + self.cost(_next, goal)
+            closed.add(current)
+            self._expanded += 1
+            current_cost = cost_so_far[current]
+            x, y = current % width, current // width
+            for _next, nx, ny in (
+                (current - width, x, y - 1) if y > 0 else (-1, 0, 0),
+                (current + 1, x + 1, y) if x + 1 < width else (-1, 0, 0),
+                (current + width, x, y + 1) if y + 1 < height else (-1, 0, 0),
+                (current - 1, x - 1, y) if x > 0 else (-1, 0, 0),
+            ):
+                if _next < 0 or _next in closed or data[_next] not in allowed:
+                    continue
+                if field is not None:
+                    new_cost = current_cost + 1 + field[_next]
+                else:
+                    new_cost = current_cost + self.cost((nx, ny))
                 if _next not in cost_so_far or new_cost < cost_so_far[_next]:
                     cost_so_far[_next] = new_cost
-                    frontier.put(_next, new_cost)
                     came_from[_next] = current
+                    h = abs(nx - goal_x) + abs(ny - goal_y)
+                    push(frontier, (new_cost + int(h * weight)) * size + _next)
         raise PathNotFoundError("Path not found")
 
 
+class JumpPointFinder(GridWatcher):
+    # A* with jump point pruning for uniform cost 8-connected movement, diagonal steps may cut corners
+    # like the hero does; costs are scaled so that a diagonal step is about sqrt(2) straight steps
+    STRAIGHT_COST = 10
+    DIAGONAL_COST = 14
+
+    def __init__(self, grid: Grid) -> None:
+        self._data = grid
+        self._expanded = 0
+        self._walkable = dict()
+
+    def attach(self) -> JumpPointFinder:
+        self._data.watch(self)
+        return self
+
+    def detach(self) -> None:
+        self._data.unwatch(self)
+
+    def changed(self, left: int, top: int, right: int, bottom: int) -> None:
+        self._walkable.clear()
+
+    def expanded(self) -> int:
+        return self._expanded
+
+    def _walkable_cells(self, allowed: Iterable[int]) -> bytearray:
+        # one byte per cell with a blocked border around the map, so jumps need no bounds checks
+        allowed = frozenset(allowed)
+        cells = self._walkable.get(allowed)
+        if cells is None:
+            width, height = self._data.width(), self._data.height()
+            tiles = self._data.mask(allowed)
+            border = bytes(width + 2)
+            cells = bytearray(border)
+            for y in range(height):
+                cells += b"\0" + tiles[y * width:(y + 1) * width] + b"\0"
+            cells += border
+            self._walkable[allowed] = cells
+        return cells
+
+    def find(self, start: tuple, goal: tuple, allowed: Iterable[int]) -> list:
+        # returns every cell from start to goal, both included
+        if not self._data.in_bounds(*start) or not self._data.in_bounds(*goal):
+            raise PathNotFoundError("Path not found")
+        cells = self._walkable_cells(allowed)
+        stride = self._data.width() + 2
+        straight, diagonal = JumpPointFinder.STRAIGHT_COST, JumpPointFinder.DIAGONAL_COST
+        start_index = (start[1] + 1) * stride + start[0] + 1
+        goal_index = (goal[1] + 1) * stride + goal[0] + 1
+        if not cells[goal_index]:
+            raise PathNotFoundError("Path not found")
+
+        def jump(index: int, dx: int, dy: int) -> int:
+            # walks in one direction until it reaches the goal, a cell with a forced neighbour or an obstacle;
+            # returns the index of the jump point or -1
+            step = dy * stride + dx
+            while True:
+                index += step
+                if not cells[index]:
+                    return -1
+                if index == goal_index:
+                    return index
+                if dx and dy:
+                    if (not cells[index - dx] and cells[index - dx + dy * stride]) or \
+                            (not cells[index - dy * stride] and cells[index + dx - dy * stride]):
+                        return index
+                    if jump(index, dx, 0) >= 0 or jump(index, 0, dy) >= 0:
+                        return index
+                elif dx:
+                    if (not cells[index - stride] and cells[index + dx - stride]) or \
+                            (not cells[index + stride] and cells[index + dx + stride]):
+                        return index
+                elif (not cells[index - 1] and cells[index - 1 + step]) or \
+                        (not cells[index + 1] and cells[index + 1 + step]):
+                    return index
+
+        def directions(index: int, parent: int) -> list:
+            if parent < 0:
+                return [(dx, dy) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dx or dy]
+            x, y = index % stride, index // stride
+            parent_x, parent_y = parent % stride, parent // stride
+            dx = (x > parent_x) - (x < parent_x)
+            dy = (y > parent_y) - (y < parent_y)
+            if dx and dy:
+                result = [(dx, 0), (0, dy), (dx, dy)]
+                if not cells[index - dx]:
+                    result.append((-dx, dy))
+                if not cells[index - dy * stride]:
+                    result.append((dx, -dy))
+            elif dx:
+                result = [(dx, 0)]
+                if not cells[index - stride]:
+                    result.append((dx, -1))
+                if not cells[index + stride]:
+                    result.append((dx, 1))
+            else:
+                result = [(0, dy)]
+                if not cells[index - 1]:
+                    result.append((-1, dy))
+                if not cells[index + 1]:
+                    result.append((1, dy))
+            return result
+
+        def distance(a: int, b: int) -> int:
+            # octile distance, exact between consecutive jump points
+            dx, dy = abs(a % stride - b % stride), abs(a // stride - b // stride)
+            return straight * abs(dx - dy) + diagonal * min(dx, dy)
+
+        frontier = [(distance(start_index, goal_index), 0, start_index)]
+        came_from = {start_index: -1}
+        cost_so_far = {start_index: 0}
+        closed = set()
+        while frontier:
+            _, current_cost, current = pop(frontier)
+            if current in closed:
+                continue
+            if current == goal_index:
+                return self._expand(current, came_from, stride)
+            closed.add(current)
+            self._expanded += 1
+            for dx, dy in directions(current, came_from[current]):
+                jump_point = jump(current, dx, dy)
+                if jump_point < 0 or jump_point in closed:
+                    continue
+                new_cost = current_cost + distance(current, jump_point)
+                if jump_point not in cost_so_far or new_cost < cost_so_far[jump_point]:
+                    cost_so_far[jump_point] = new_cost
+                    came_from[jump_point] = current
+                    push(frontier, (new_cost + distance(jump_point, goal_index), new_cost, jump_point))
+        raise PathNotFoundError("Path not found")
+
+    @staticmethod
+    def _expand(current: int, came_from: dict, stride: int) -> list:
+        # jump points are joined by straight or diagonal runs, indices are shifted by the border
+        path = [(current % stride - 1, current // stride - 1)]
+        parent = came_from[current]
+        while parent >= 0:
+            x, y = current % stride, current // stride
+            parent_x, parent_y = parent % stride, parent // stride
+            dx = (parent_x > x) - (parent_x < x)
+            dy = (parent_y > y) - (parent_y < y)
+            while (x, y) != (parent_x, parent_y):
+                x += dx
+                y += dy
+                path.append((x - 1, y - 1))
+            current, parent = parent, came_from[parent]
+        path.reverse()
+        return path
+
+
 class Room(Rect):
+    __slots__ = ()
 
     def priority(self):
         return self._y * self._x
@@ -161,14 +336,21 @@ class _Generator:
     MIN_ROOM_SIZE = 8
     MAX_ROOM_SIZE = 16
     MIN_DISTANCE_BETWEEN_ROOMS = 8
+    # random candidates tried for one room before placement gives up, the rooms placed so far are kept
+    ROOM_PLACEMENT_ATTEMPTS = 500
+    # generation fails when fewer rooms fit into the map
+    MIN_NUMBER_OF_ROOMS = 1
+    # weighted A* factors, roughly the cheapest step cost of the matching cost function
+    CAVES_PATH_WEIGHT = 8.0
+    ROOMS_PATH_WEIGHT = 6.0
 
     DRUNK_MAN_ALLOWED = {
         Tiles.TILE_CAVE
     }
 
-    COST_CAVES_ALLOWED = {
-        Tiles.TILE_CAVE,
-        Tiles.TILE_GROUND
+    COST_CAVES_WEIGHTS = {
+        Tiles.TILE_CAVE: 1,
+        Tiles.TILE_GROUND: 10  # in order to make more ways
     }
 
     NEED_CONNECT_ALLOWED = {
@@ -180,17 +362,17 @@ class _Generator:
         Tiles.TILE_CAVE
     }
 
-    COST_ROOMS_ALLOWED = {
-        Tiles.TILE_CORRIDOR,
-        Tiles.TILE_GROUND,
-        Tiles.TILE_WALL_H,
-        Tiles.TILE_WALL_V,
-        Tiles.TILE_FLOOR,
-        Tiles.TILE_DOOR,
-        Tiles.TILE_WALL_TL,
-        Tiles.TILE_WALL_BL,
-        Tiles.TILE_WALL_BR,
-        Tiles.TILE_WALL_TR
+    COST_ROOMS_WEIGHTS = {
+        Tiles.TILE_GROUND: 5,
+        Tiles.TILE_FLOOR: 1,
+        Tiles.TILE_WALL_H: 50,
+        Tiles.TILE_WALL_V: 50,
+        Tiles.TILE_WALL_TL: 70,
+        Tiles.TILE_WALL_BL: 70,
+        Tiles.TILE_WALL_BR: 70,
+        Tiles.TILE_WALL_TR: 70,
+        Tiles.TILE_CORRIDOR: 1,
+        Tiles.TILE_DOOR: 1
     }
 
     CONNECT_ROOMS_ALLOWED = {
@@ -202,130 +384,153 @@ class _Generator:
         Tiles.TILE_DOOR
     }
 
+    CONNECT_PORTALS_ALLOWED = CONNECT_ROOMS_ALLOWED | {
+        Tiles.TILE_CAVE
+    }
+
     CLEAN_UP_ALLOWED = {
         Tiles.TILE_CORRIDOR
     }
 
-    def __init__(self, width: int, height: int, progress: Callable[[int], None] = None) -> None:
+    def __init__(self, width: int, height: int, progress: Callable[[int], None] = None,
+                 rng: random.Random = None, portals: Iterable[tuple] = ()) -> None:
+        self._random = rng if rng is not None else random.Random()
+        self._portals = list(portals)
         self._width = width
         self._height = height
         self._data = Grid(width, height, init_value=Tiles.TILE_CAVE)
         self._progress_callback = progress
         self._rooms = list()
+        # placed rooms are bucketed by a uniform grid, a candidate is only checked against its neighbourhood
+        self._room_cell_size = _Generator.MAX_ROOM_SIZE + _Generator.MIN_DISTANCE_BETWEEN_ROOMS
+        self._room_buckets = dict()
         self._cave_nooks = list()
+        self._expanded = 0
+        self._stats = dict()
 
     def _random_room(self) -> Room:
-        size = random.randrange(_Generator.MIN_ROOM_SIZE, _Generator.MAX_ROOM_SIZE)
+        size = self._random.randrange(_Generator.MIN_ROOM_SIZE, _Generator.MAX_ROOM_SIZE)
         if size % 4:
             room_height = size
             room_width = size // 3 * 4
         else:
             room_width = size
             room_height = size // 3 * 4
-        x = random.randrange(0, self._width - room_width)
-        y = random.randrange(0, self._height - room_height)
+        x = self._random.randrange(0, self._width - room_width)
+        y = self._random.randrange(0, self._height - room_height)
         return Room(x, y, room_width, room_height)
 
-    def _generate_room(self) -> Room:
-        while True:
+    def _room_buckets_in(self, left: int, top: int, right: int, bottom: int) -> Iterator[tuple]:
+        cell_size = self._room_cell_size
+        for bucket_y in range(top // cell_size, bottom // cell_size + 1):
+            for bucket_x in range(left // cell_size, right // cell_size + 1):
+                yield bucket_x, bucket_y
+
+    def _room_fits(self, new_room: Room) -> bool:
+        distance = _Generator.MIN_DISTANCE_BETWEEN_ROOMS
+        left, top, right, bottom = new_room.bounds()
+        for bucket in self._room_buckets_in(left - distance, top - distance, right + distance, bottom + distance):
+            for room in self._room_buckets.get(bucket, ()):
+                if room.intersects(new_room, min_distance=distance):
+                    return False
+        return True
+
+    def _add_room(self, room: Room) -> None:
+        self._rooms.append(room)
+        for bucket in self._room_buckets_in(*room.bounds()):
+            self._room_buckets.setdefault(bucket, []).append(room)
+
+    def _generate_room(self) -> Optional[Room]:
+        # returns None when no candidate fits within the attempt budget
+        for _ in range(_Generator.ROOM_PLACEMENT_ATTEMPTS):
             new_room = self._random_room()
-            for room in self._rooms:
-                if room.intersects(new_room, min_distance=_Generator.MIN_DISTANCE_BETWEEN_ROOMS):
-                    break
-            else:
+            if self._room_fits(new_room):
                 return new_room
-
-    def _drunk_man(self, start_x: int, start_y: int, depth: int = 5) -> tuple:
-        if not self._data.in_bounds(start_x, start_y):
-            return -1, -1, -1
-        drunk_x, drunk_y = start_x, start_y
-        nk_x, nk_y, nk_d = 0, 0, 0
-        for _ in range(0, depth):
-            select = random.randrange(0, 4)
-            if select == 0 and drunk_y > 0:  # up
-                drunk_y -= 1
-            elif select == 1 and drunk_x < self._width - 1:  # right
-                drunk_x += 1
-            elif select == 2 and drunk_y < self._height - 1:  # down
-                drunk_y += 1
-            elif select == 3 and drunk_x > 0:  # left
-                drunk_x -= 1
-            for x, y in self._data.neighbours(drunk_x, drunk_y, allowed=_Generator.DRUNK_MAN_ALLOWED):
-                self._data.put(x, y, Tiles.TILE_GROUND)
-                d = Point.dst(x, y, start_x, start_y)
-                if d > nk_d:
-                    nk_d = d
-                    nk_x = x
-                    nk_y = y
-        return nk_x, nk_y, nk_d
-
-    def _cost_caves(self, to: tuple) -> int:
-        weight = 0
-        for x, y in self._data.neighbours(*to, allowed=_Generator.COST_CAVES_ALLOWED, diagonals=True):
-            neighbour_type = self._data.get(x, y)
-            if neighbour_type == Tiles.TILE_CAVE:
-                weight += 1
-            elif neighbour_type == Tiles.TILE_GROUND:
-                weight += 10  # in order to make more ways
-
-        return weight
-
-    def _connect_pair_caves(self, a: Room, b: Room) -> None:
-        path_finder = PathFinder(self._data, self._cost_caves)
+        return None
+
+    def _drunk_walk(self, starts: list, min_depth: int, max_depth: int) -> list:
+        # one random walk from every start cell: depths and directions of all walkers are drawn in two calls and
+        # the carved cells are written at once. Every step carves the cave cells around the walker, the result is
+        # (x, y, distance) of the farthest cell each walker carved from its start
+        width, height = self._width, self._height
+        count = len(starts)
+        depths = self._random.choices(range(min_depth, max_depth), k=count)
+        directions = self._random.randbytes(count * (max_depth - 1))
+        cave = self._data.mask(_Generator.DRUNK_MAN_ALLOWED)
+        carved = list()
+        result = list()
+        for walker, (start_x, start_y) in enumerate(starts):
+            if not (0 <= start_x < width and 0 <= start_y < height):
+                result.append((-1, -1, -1))
+                continue
+            x, y = start_x, start_y
+            best_x, best_y, best = 0, 0, 0
+            offset = walker * (max_depth - 1)
+            for select in directions[offset:offset + depths[walker]]:
+                select &= 3
+                if select == 0 and y > 0:  # up
+                    y -= 1
+                elif select == 1 and x < width - 1:  # right
+                    x += 1
+                elif select == 2 and y < height - 1:  # down
+                    y += 1
+                elif select == 3 and x > 0:  # left
+                    x -= 1
+                i = y * width + x
+                for nx, ny, ni in (
+                    (x, y - 1, i - width) if y > 0 else (0, 0, -1),
+                    (x + 1, y, i + 1) if x + 1 < width else (0, 0, -1),
+                    (x, y + 1, i + width) if y + 1 < height else (0, 0, -1),
+                    (x - 1, y, i - 1) if x > 0 else (0, 0, -1),
+                ):
+                    if ni < 0 or not cave[ni]:
+                        continue
+                    cave[ni] = 0
+                    carved.append(ni)
+                    # squared distances keep the comparison in integers
+                    d = (nx - start_x) ** 2 + (ny - start_y) ** 2
+                    if d > best:
+                        best_x, best_y, best = nx, ny, d
+            result.append((best_x, best_y, isqrt(best)))
+        self._data.put_indices(carved, Tiles.TILE_GROUND)
+        return result
+
+    def _connect_pair_caves(self, a: Room, b: Room, cost: CostField) -> None:
+        path_finder = PathFinder(self._data, cost, weight=_Generator.CAVES_PATH_WEIGHT)
         try:
             path = path_finder.find(a.center(), b.center(), allowed=_Generator.CONNECT_CAVES_ALLOWED)
             for ptr in path:
                 for x, y in self._data.neighbours(*ptr, allowed=_Generator.CONNECT_CAVES_ALLOWED, diagonals=True):
                     if self._data.get(x, y) == Tiles.TILE_CAVE:
                         self._data.put(x, y, Tiles.TILE_CORRIDOR)
-            for ptr in path:
-                x, y, d = self._drunk_man(*ptr, depth=random.randrange(2, 5))
+            for x, y, d in self._drunk_walk(path, 2, 5):
                 if d >= 2:
                     self._cave_nooks.append(Point(x, y))
 
         except PathNotFoundError:
             pass
+        finally:
+            self._expanded += path_finder.expanded()
 
     def _connect_all_caves(self) -> None:
+        cost = CostField(self._data, _Generator.COST_CAVES_WEIGHTS).attach()
         for a, b in zip(self._rooms, self._rooms[1:]):
-            self._connect_pair_caves(a, b)
+            self._connect_pair_caves(a, b, cost)
+        cost.detach()
 
     def _generate_caves(self) -> None:
         for room in self._rooms:
             left, top, right, bottom = room.bounds()
             center_x, center_y = room.center()
             distance = min(abs(center_x - left), abs(center_y - top)) + 1
-            for cx in range(left, right + 1):
-                for cy in range(top, bottom + 1):
-                    x, y, _ = self._drunk_man(cx, cy, depth=random.randrange(4, 7))
-                    d = Point.dst(x, y, center_x, center_y)
-                    if d > distance and _ > 0 and x != left and x != right and y != top and y != bottom:
-                        self._cave_nooks.append(Point(x, y))
-
-    def _cost_rooms(self, to: tuple) -> int:
-        weight = 0
-        for x, y in self._data.neighbours(*to, allowed=_Generator.COST_ROOMS_ALLOWED, diagonals=True):
-            neighbour_type = self._data.get(x, y)
-            if neighbour_type == Tiles.TILE_GROUND:
-                weight += 5
-            elif neighbour_type == Tiles.TILE_FLOOR:
-                weight += 1
-            elif neighbour_type == Tiles.TILE_WALL_H or neighbour_type == Tiles.TILE_WALL_V:
-                weight += 50
-            elif neighbour_type == Tiles.TILE_WALL_TL or neighbour_type == Tiles.TILE_WALL_BL:
-                weight += 70
-            elif neighbour_type == Tiles.TILE_WALL_BR or neighbour_type == Tiles.TILE_WALL_TR:
-                weight += 70
-            elif neighbour_type == Tiles.TILE_CORRIDOR:
-                weight += 1
-            elif neighbour_type == Tiles.TILE_DOOR:
-                weight += 1
-            elif neighbour_type == Tiles.TILE_CAVE:
-                weight += 10
-        return weight
-
-    def _connect_pair_rooms(self, a: Room, b: Room) -> None:
-        path_finder = PathFinder(self._data, self._cost_rooms)
+            starts = [(cx, cy) for cx in range(left, right + 1) for cy in range(top, bottom + 1)]
+            for x, y, walked in self._drunk_walk(starts, 4, 7):
+                d = Point.dst(x, y, center_x, center_y)
+                if d > distance and walked > 0 and x != left and x != right and y != top and y != bottom:
+                    self._cave_nooks.append(Point(x, y))
+
+    def _connect_pair_rooms(self, a: Room, b: Room, cost: CostField) -> None:
+        path_finder = PathFinder(self._data, cost, weight=_Generator.ROOMS_PATH_WEIGHT)
         try:
             for ptr in path_finder.find(a.center(), b.center(), allowed=_Generator.CONNECT_ROOMS_ALLOWED):
                 cell_type = self._data.get(*ptr)
@@ -335,17 +540,44 @@ class _Generator:
                     self._data.put(*ptr, Tiles.TILE_CORRIDOR)
         except PathNotFoundError:
             pass
+        finally:
+            self._expanded += path_finder.expanded()
 
     def _connect_all_rooms(self) -> None:
+        cost = CostField(self._data, _Generator.COST_ROOMS_WEIGHTS).attach()
         for a, b in zip(self._rooms, self._rooms[1:]):
-            self._connect_pair_rooms(a, b)
+            self._connect_pair_rooms(a, b, cost)
+        cost.detach()
+
+    def _connect_portal(self, portal: tuple, cost: CostField) -> None:
+        # portals are border cells shared with a neighbouring map, carve a corridor to the closest room
+        room = min(self._rooms, key=lambda r: Point.dst(*portal, *r.center()))
+        path_finder = PathFinder(self._data, cost, weight=_Generator.ROOMS_PATH_WEIGHT)
+        try:
+            for ptr in path_finder.find(portal, room.center(), allowed=_Generator.CONNECT_PORTALS_ALLOWED):
+                cell_type = self._data.get(*ptr)
+                if cell_type == Tiles.TILE_WALL_H or cell_type == Tiles.TILE_WALL_V:
+                    self._data.put(*ptr, Tiles.TILE_DOOR)
+                elif cell_type == Tiles.TILE_GROUND or cell_type == Tiles.TILE_CAVE:
+                    self._data.put(*ptr, Tiles.TILE_CORRIDOR)
+        except PathNotFoundError:
+            pass
+        finally:
+            self._expanded += path_finder.expanded()
+
+    def _connect_all_portals(self) -> None:
+        if not self._portals:
+            return
+        cost = CostField(self._data, _Generator.COST_ROOMS_WEIGHTS).attach()
+        for portal in self._portals:
+            self._connect_portal(portal, cost)
+        cost.detach()
 
     def _clean_up(self) -> None:
-        for x in range(1, self._width - 1):
-            for y in range(1, self._height - 1):
-                if self._data.get(x, y) == Tiles.TILE_CAVE:
-                    for nx, ny in self._data.neighbours(x, y, allowed=_Generator.CLEAN_UP_ALLOWED, diagonals=True):
-                        self._data.put(nx, ny, Tiles.TILE_GROUND)
+        # corridors touching a cave cell that is not on the map border become ground
+        caves = self._data.cell_mask({Tiles.TILE_CAVE}).interior()
+        corridors = self._data.cell_mask(_Generator.CLEAN_UP_ALLOWED)
+        self._data.put_mask((caves.dilate() & corridors).to_bytes(), Tiles.TILE_GROUND)
 
     def _progress(self, progress: int):
         if self._progress_callback is not None:
@@ -370,22 +602,70 @@ class _Generator:
                 else:
                     self._data.put(x, y, Tiles.TILE_FLOOR)
 
-    def run(self) -> None:
+    def _generate_rooms(self) -> None:
+        # rooms are stretched by 4/3 along one side, the map has to be wider than the longest side
+        if min(self._width, self._height) <= (_Generator.MAX_ROOM_SIZE - 1) // 3 * 4:
+            raise RoomPlacementError("Map {}x{} is too small for rooms".format(self._width, self._height))
         while len(self._rooms) < _Generator.NUMBER_OF_ROOMS:
-            self._rooms.append(self._generate_room())
-        self._progress(10)
+            room = self._generate_room()
+            if room is None:
+                break
+            self._add_room(room)
+        if len(self._rooms) < _Generator.MIN_NUMBER_OF_ROOMS:
+            raise RoomPlacementError("Only {} of {} rooms fit into {}x{} map".format(
+                len(self._rooms), _Generator.NUMBER_OF_ROOMS, self._width, self._height))
         self._rooms.sort(key=lambda x: x.priority())
-        self._generate_caves()
-        self._progress(30)
-        self._connect_all_caves()
-        self._progress(50)
+
+    def _copy_all_rooms(self) -> None:
         for room in self._rooms:
             self._copy_room_data(room)
-        self._connect_all_rooms()
+
+    def _run_phase(self, name: str, phase: Callable[[], None]) -> None:
+        # peak memory is only known while tracemalloc is tracing, see bench_generation.py
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        expanded = self._expanded
+        start = perf_counter()
+        phase()
+        self._stats[name] = {
+            "time": perf_counter() - start,
+            "peak_memory": tracemalloc.get_traced_memory()[1] if tracing else None,
+            "expanded": self._expanded - expanded,
+        }
+
+    def run(self) -> None:
+        self._run_phase("rooms", self._generate_rooms)
+        self._progress(10)
+        self._run_phase("caves", self._generate_caves)
+        self._progress(30)
+        self._run_phase("connect_caves", self._connect_all_caves)
+        self._progress(50)
+        self._run_phase("copy_rooms", self._copy_all_rooms)
+        self._run_phase("connect_rooms", self._connect_all_rooms)
+        self._run_phase("connect_portals", self._connect_all_portals)
         self._progress(70)
-        self._clean_up()
+        self._run_phase("clean_up", self._clean_up)
         self._progress(100)
 
+    def stats(self) -> dict:
+        return self._stats
+
+    @staticmethod
+    def constants() -> tuple:
+        # everything that changes the output for a given seed
+        return (
+            _Generator.NUMBER_OF_ROOMS,
+            _Generator.MIN_ROOM_SIZE,
+            _Generator.MAX_ROOM_SIZE,
+            _Generator.MIN_DISTANCE_BETWEEN_ROOMS,
+            _Generator.ROOM_PLACEMENT_ATTEMPTS,
+            _Generator.CAVES_PATH_WEIGHT,
+            _Generator.ROOMS_PATH_WEIGHT,
+            sorted(_Generator.COST_CAVES_WEIGHTS.items()),
+            sorted(_Generator.COST_ROOMS_WEIGHTS.items()),
+        )
+
     def data(self) -> Grid:
         return self._data
 
@@ -400,6 +680,12 @@ class Dungeon:
     # fog of war constants
     TILE_NOT_VISITED = 0
     TILE_VISITED = 1
+    VISIBLE_DISTANCE = 7
+    # monsters further than this from the hero do not move, it also bounds the distance maps
+    CHASE_DISTANCE = 24
+    FLEEING_MONSTERS = (
+        Tiles.MON_LEPRECHAUN,
+    )
 
     MOVEMENT_ALLOWED = (
         Tiles.TILE_DOOR,
@@ -408,6 +694,14 @@ class Dungeon:
         Tiles.TILE_GROUND
     )
 
+    # clusters of the hierarchical path finder never mix these
+    REGION_CLASSES = (
+        (Tiles.TILE_FLOOR,),
+        (Tiles.TILE_DOOR,),
+        (Tiles.TILE_CORRIDOR,),
+        (Tiles.TILE_GROUND,),
+    )
+
     STOP_TILES = (
         Tiles.TILE_DOOR,
         Tiles.TILE_CAVE,
@@ -419,20 +713,76 @@ class Dungeon:
         Tiles.TILE_WALL_V,
     )
 
-    def __init__(self, width: int, height: int, progress: Callable[[int], None] = None):
-        generator = _Generator(width, height, progress)
+    def __init__(self, width: int, height: int, progress: Callable[[int], None] = None, seed: int = None,
+                 portals: Iterable[tuple] = (), reveal_start: bool = True):
+        if seed is None:
+            seed = random.randrange(1 << 32)
+        self._seed = seed
+        rng = random.Random(seed)
+        generator = _Generator(width, height, progress, rng, portals)
         generator.run()
         self._data = generator.data()
-        self._fog_of_war = Grid(width, height, Dungeon.TILE_NOT_VISITED)
+        self._fog_of_war = BitGrid(width, height)
         self._rooms = generator.rooms()
         self._nooks = generator.nooks()
-        self._objects = list()
-        self._monsters = list()
+        self._objects = EntityStore()
+        self._monsters = EntityStore()
         self._hero_position = Point(*self._rooms[0].center())
-        self._place_objects()
-        self.update_visible()
-
-    def _place_objects(self) -> None:
+        self._fog_version = 0
+        self._chase_map = None
+        self._flee_map = None
+        self._path_finder = None
+        self._regions = None
+        self._place_objects(rng)
+        if reveal_start:
+            self.update_visible()
+
+    def pack(self) -> tuple:
+        return (
+            self._seed,
+            self.width(),
+            self.height(),
+            self._data.raw().tobytes(),
+            bytes(self._fog_of_war.raw()),
+            self._hero_position.tup(),
+            tuple(self._objects.entities()),
+            tuple(self._monsters.entities()),
+        )
+
+    @staticmethod
+    def unpack(payload: tuple) -> Dungeon:
+        seed, width, height, tiles, fog_of_war, hero_position, objects, monsters = payload
+        return Dungeon.restore(
+            seed,
+            Grid(width, height, data=array(Grid.TYPECODE, tiles)),
+            BitGrid(width, height, data=bytearray(fog_of_war)),
+            hero_position,
+            objects,
+            monsters
+        )
+
+    @staticmethod
+    def restore(seed: int, data: Grid, fog_of_war: BitGrid, hero_position: tuple,
+                objects: Iterable[tuple], monsters: Iterable[tuple]) -> Dungeon:
+        dungeon = Dungeon.__new__(Dungeon)
+        dungeon._seed = seed
+        dungeon._data = data
+        dungeon._fog_of_war = fog_of_war
+        dungeon._hero_position = Point(*hero_position)
+        dungeon._fog_version = 0
+        dungeon._chase_map = None
+        dungeon._flee_map = None
+        dungeon._path_finder = None
+        dungeon._regions = None
+        dungeon._objects = EntityStore()
+        dungeon._monsters = EntityStore()
+        for obj in objects:
+            dungeon.add_object(*obj)
+        for mon in monsters:
+            dungeon.add_monster(*mon)
+        return dungeon
+
+    def _place_objects(self, rng: random.Random) -> None:
         random_objects = [
             -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1, -1,
             -2, -2, -2, -2, -2, -2, -2, -2, -2, -2, -2, -2, -2, -2, -2, -2, -2, -2, -2, -2, -2,
@@ -447,16 +797,16 @@ class Dungeon:
             Tiles.MON_CENTAUR, Tiles.MON_KIWI, Tiles.MON_VENUS, Tiles.MON_TROLL, Tiles.MON_GHOST,
             Tiles.MON_BLACK_BIRD, Tiles.MON_LEPRECHAUN, Tiles.MON_ZOMBIE_GIRL
         ]
-        random.shuffle(random_objects)
-        random.shuffle(random_monsters)
+        rng.shuffle(random_objects)
+        rng.shuffle(random_monsters)
         for nook_point in self._nooks:
-            random.shuffle(random_objects)  # shuffle twice:)
-            obj_id = random.choice(random_objects)
+            rng.shuffle(random_objects)  # shuffle twice:)
+            obj_id = rng.choice(random_objects)
             if obj_id < 0:
                 if obj_id == -1:
-                    self._monsters.append(Monster(*nook_point.tup(), random.choice(random_monsters)))
+                    self.add_monster(*nook_point.tup(), rng.choice(random_monsters))
                 continue
-            self._objects.append(Loot(*nook_point.tup(), obj_id))
+            self.add_object(*nook_point.tup(), obj_id)
         room_monsters = [
             Tiles.MON_HYDRA, Tiles.MON_GRIFFIN, Tiles.MON_DRAGON, Tiles.MON_LEPRECHAUN,
             Tiles.MON_ZOMBIE_GIRL, Tiles.MON_CENTAUR
@@ -465,31 +815,44 @@ class Dungeon:
             Tiles.OBJ_WEAPON, Tiles.OBJ_ROD, Tiles.OBJ_ARMOR, Tiles.OBJ_RING, Tiles.OBJ_SCROLL,
             Tiles.OBJ_POTION, Tiles.OBJ_COINS, Tiles.OBJ_COINS
         ]
-        random.shuffle(room_monsters)
-        random.shuffle(room_objects)
+        rng.shuffle(room_monsters)
+        rng.shuffle(room_objects)
         for room in self._rooms:
             l, t, r, b = room.bounds()
-            if random.random() < 0.5:
-                obj_id = random.choice(room_objects)
-                rand_x = random.randrange(l+1, r-1)
-                rand_y = random.randrange(t+1, b-1)
-                self._objects.append(Loot(rand_x, rand_y, obj_id))
-
-            if random.random() < 0.5:
-                mon_id = random.choice(room_monsters)
-                rand_x = random.randrange(l+1, r-1)
-                rand_y = random.randrange(t+1, b-1)
-                self._monsters.append(Monster(rand_x, rand_y, mon_id))
+            if rng.random() < 0.5:
+                obj_id = rng.choice(room_objects)
+                rand_x = rng.randrange(l+1, r-1)
+                rand_y = rng.randrange(t+1, b-1)
+                self.add_object(rand_x, rand_y, obj_id)
+
+            if rng.random() < 0.5:
+                mon_id = rng.choice(room_monsters)
+                rand_x = rng.randrange(l+1, r-1)
+                rand_y = rng.randrange(t+1, b-1)
+                self.add_monster(rand_x, rand_y, mon_id)
 
         del self._nooks
         del self._rooms
 
+    @staticmethod
+    def cache_key(seed: int, width: int, height: int) -> tuple:
+        return seed, width, height, _Generator.constants()
+
+    def seed(self) -> int:
+        return self._seed
+
     def area(self, area: Rect) -> Grid:
         return self._data.copy(*area.bounds())
 
+    def tiles(self) -> Grid:
+        return self._data
+
     def hero_position(self) -> Point:
         return self._hero_position
 
+    def move_hero(self, dx: int, dy: int) -> None:
+        self._hero_position = self._hero_position.moved(dx, dy)
+
     def width(self) -> int:
         return self._data.width()
 
@@ -509,26 +872,130 @@ class Dungeon:
         cell_type = self._data.get(new_x, new_y)
         return cell_type in Dungeon.MOVEMENT_ALLOWED
 
+    def find_path(self, start: tuple, goal: tuple) -> list:
+        # cells from start to goal for click-to-move and auto-explore, raises PathNotFoundError
+        if self._path_finder is None:
+            self._path_finder = JumpPointFinder(self._data)
+        return self._path_finder.find(start, goal, Dungeon.MOVEMENT_ALLOWED)
+
+    def regions(self) -> RegionGraph:
+        # built on the first long distance query
+        if self._regions is None:
+            self._regions = RegionGraph(self._data, Dungeon.REGION_CLASSES)
+        return self._regions
+
+    def find_route(self, start: tuple, goal: tuple) -> list:
+        # waypoints across the map solved on the region graph, raises PathNotFoundError
+        route = self.regions().route(start, goal)
+        if not route:
+            raise PathNotFoundError("Path not found")
+        return route
+
+    def next_segment(self, start: tuple, goal: tuple) -> list:
+        # cells to walk now, only the first segment of the route is searched at tile level
+        route = self.find_route(start, goal)
+        return self.regions().refine(start, route[1]) if len(route) > 1 else route
+
     def is_visited(self, x: int, y: int) -> bool:
         return self._fog_of_war.get(x, y) == Dungeon.TILE_VISITED
 
     def update_visible(self) -> None:
-        dist = 7  # 14 solved eq. used for brightness function 0.25 + 4 / distance > 0.5
-        start_x = max(0, self._hero_position.x - dist)
-        start_y = max(0, self._hero_position.y - dist)
-        end_x = min(self._fog_of_war.width(), self._hero_position.x + dist)
-        end_y = min(self._fog_of_war.height(), self._hero_position.y + dist)
-        for x in range(start_x, end_x):
-            for y in range(start_y, end_y):
-                if self._hero_position.distance(x, y) <= dist:
-                    self._fog_of_war.put(x, y, Dungeon.TILE_VISITED)
+        self.reveal(self._hero_position.x, self._hero_position.y)
+
+    def reveal(self, x: int, y: int, radius: int = VISIBLE_DISTANCE) -> bool:
+        # 7 solved eq. used for brightness function 0.25 + 4 / distance > 0.5
+        if self._fog_of_war.stamp(x, y, BitGrid.disk(radius)):
+            self._fog_version += 1
+            return True
+        return False
+
+    def fog_version(self) -> int:
+        # changes every time a tile gets revealed, renderers use it to invalidate cached layers
+        return self._fog_version
+
+    def add_object(self, x: int, y: int, type_id: int, flags: int = 0) -> Loot:
+        return Loot(self._objects, self._objects.add(x, y, type_id, flags))
+
+    def remove_object(self, loot: Loot) -> None:
+        self._objects.remove(loot.slot())
+
+    def add_monster(self, x: int, y: int, type_id: int, flags: int = 0) -> Monster:
+        return Monster(self._monsters, self._monsters.add(x, y, type_id, flags))
+
+    def remove_monster(self, monster: Monster) -> None:
+        self._monsters.remove(monster.slot())
 
     def objects(self) -> list:
+        return [Loot(self._objects, slot) for slot in self._objects.slots()]
+
+    def objects_at(self, x: int, y: int) -> list:
+        return [Loot(self._objects, slot) for slot in self._objects.at(x, y)]
+
+    def objects_in(self, area: Rect) -> Iterator[tuple]:
+        return ((x, y, Loot(self._objects, slot)) for x, y, slot in self._objects.query(area))
+
+    def object_types_in(self, area: Rect) -> Iterator[tuple]:
+        # (x, y, type) without creating handles, for renderers
+        return self._objects.types_in(area)
+
+    def object_store(self) -> EntityStore:
         return self._objects
 
+    def monsters_at(self, x: int, y: int) -> list:
+        return [Monster(self._monsters, slot) for slot in self._monsters.at(x, y)]
+
+    def monsters_in(self, area: Rect) -> Iterator[tuple]:
+        return ((x, y, Monster(self._monsters, slot)) for x, y, slot in self._monsters.query(area))
+
+    def monster_types_in(self, area: Rect) -> Iterator[tuple]:
+        return self._monsters.types_in(area)
+
     def monsters(self) -> list:
+        return [Monster(self._monsters, slot) for slot in self._monsters.slots()]
+
+    def monster_store(self) -> EntityStore:
         return self._monsters
 
+    def move_monsters(self) -> None:
+        self.chase(*self._hero_position.tup())
+
+    def chase(self, x: int, y: int) -> None:
+        # all monsters around the target share one distance map and step to their lowest free neighbour
+        distance = Dungeon.CHASE_DISTANCE
+        if self._chase_map is None:
+            self._chase_map = DijkstraMap(self._data, Dungeon.MOVEMENT_ALLOWED, distance)
+        self._chase_map.set_goal(x, y)
+        monsters = self._monsters
+        nearby = list(monsters.query(Rect(x - distance, y - distance, 2 * distance + 1, 2 * distance + 1)))
+        for monster_x, monster_y, slot in nearby:
+            if monsters.type(slot) in Dungeon.FLEEING_MONSTERS:
+                distance_map = self._fleeing_map()
+            else:
+                distance_map = self._chase_map
+            for _, dx, dy in distance_map.steps(monster_x, monster_y):
+                new_x, new_y = monster_x + dx, monster_y + dy
+                if (new_x, new_y) == (x, y) or monsters.at(new_x, new_y):
+                    continue
+                monsters.move(slot, dx, dy)
+                break
+
+    def _fleeing_map(self) -> DijkstraMap:
+        # derived from the chase map, only refilled after the chase map has changed; the map object is kept
+        # so its cached links are reused
+        version = self._chase_map.version()
+        if self._flee_map is None:
+            self._flee_map = (None, DijkstraMap(self._data, Dungeon.MOVEMENT_ALLOWED, 0))
+        if self._flee_map[0] != version:
+            self._flee_map[1].set_goals(self._chase_map.flee_goals())
+            self._flee_map = (version, self._flee_map[1])
+        return self._flee_map[1]
+
+
+def generate_packed(width: int, height: int, progress_queue: Queue = None, seed: int = None) -> tuple:
+    # entry point for worker processes: only a compact picklable payload crosses the process boundary
+    progress = progress_queue.put if progress_queue is not None else None
+    return Dungeon(width, height, progress, seed).pack()
+
 
 if __name__ == '__main__':
     gen = Dungeon(128, 128)
@@ -0,0 +1,56 @@
+from __future__ import annotations
+import os
+import hashlib
+from queue import Queue
+from typing import Callable, Optional
+from rpg.dungeon import Dungeon
+from rpg.dungeon_file import DungeonFile, DungeonFormatError
+
+
+class DungeonCache:
+    VERSION = 5
+    DEFAULT_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "roguelike", "dungeons")
+    EXTENSION = ".dungeon"
+
+    def __init__(self, directory: str = DEFAULT_DIRECTORY) -> None:
+        self._directory = directory
+
+    def key(self, seed: int, width: int, height: int) -> str:
+        key = (DungeonCache.VERSION, Dungeon.cache_key(seed, width, height))
+        return hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+
+    def path(self, seed: int, width: int, height: int) -> str:
+        return os.path.join(self._directory, self.key(seed, width, height) + DungeonCache.EXTENSION)
+
+    def load(self, seed: int, width: int, height: int) -> Optional[Dungeon]:
+        try:
+            return DungeonFile.load(self.path(seed, width, height))
+        except (OSError, ValueError, DungeonFormatError):
+            return None
+
+    def store(self, dungeon: Dungeon) -> None:
+        os.makedirs(self._directory, exist_ok=True)
+        DungeonFile.save(dungeon, self.path(dungeon.seed(), dungeon.width(), dungeon.height()))
+
+    def get(self, seed: int, width: int, height: int, progress: Callable[[int], None] = None) -> Dungeon:
+        dungeon = self.load(seed, width, height)
+        if dungeon is None:
+            dungeon = Dungeon(width, height, progress, seed)
+            try:
+                self.store(dungeon)
+            except DungeonFormatError:
+                # seeds the file format cannot hold are generated every time
+                pass
+        elif progress is not None:
+            progress(100)
+        return dungeon
+
+    def get_packed(self, seed: int, width: int, height: int, progress: Callable[[int], None] = None) -> tuple:
+        return self.get(seed, width, height, progress).pack()
+
+
+def generate_packed_cached(directory: str, width: int, height: int, progress_queue: Queue = None,
+                           seed: int = None) -> tuple:
+    # worker process entry point, see rpg.dungeon.generate_packed
+    progress = progress_queue.put if progress_queue is not None else None
+    return DungeonCache(directory).get_packed(seed, width, height, progress)
@@ -0,0 +1,109 @@
+from __future__ import annotations
+import os
+import mmap
+import struct
+import tempfile
+from typing import BinaryIO
+from rpg.dungeon import Dungeon, Tiles
+from rpg.utils import Grid, BitGrid
+
+
+class DungeonFormatError(ValueError):
+    pass
+
+
+class DungeonFile:
+    # layout: header | tiles (1 signed byte per cell, row-major) | fog of war (BitGrid rows) |
+    #         loot records | monster records
+    # files are about as large as the pickled pack tuple, the point of the format is that tiles and
+    # fog of war are used in place from a memory mapping instead of being unpickled
+    MAGIC = b"RLDG"
+    VERSION = 3
+    HEADER = struct.Struct("<4sHHIIQiiII")
+    # x, y, type and flags
+    ENTITY = struct.Struct("<iiBB")
+    MAX_SEED = (1 << 64) - 1
+
+    @staticmethod
+    def dumps(dungeon: Dungeon) -> bytes:
+        seed, width, height, tiles, fog_of_war, hero_position, objects, monsters = dungeon.pack()
+        if not 0 <= seed <= DungeonFile.MAX_SEED:
+            raise DungeonFormatError("Seed {} does not fit in an unsigned 64-bit integer".format(seed))
+        chunks = [
+            DungeonFile.HEADER.pack(
+                DungeonFile.MAGIC, DungeonFile.VERSION, 0, width, height, seed,
+                *hero_position, len(objects), len(monsters)
+            ),
+            tiles,
+            fog_of_war,
+        ]
+        chunks.extend(DungeonFile.ENTITY.pack(*entity) for entity in objects)
+        chunks.extend(DungeonFile.ENTITY.pack(*entity) for entity in monsters)
+        return b"".join(chunks)
+
+    @staticmethod
+    def loads(buffer: bytes) -> Dungeon:
+        # the loaded grids are views into the buffer, so it has to be writable
+        return DungeonFile._load(memoryview(bytearray(buffer)))
+
+    @staticmethod
+    def save(dungeon: Dungeon, path: str) -> None:
+        # written next to the target and renamed over it: readers never see a partial file and pages
+        # still mapped from the previous version stay valid
+        descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(DungeonFile.dumps(dungeon))
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    @staticmethod
+    def load(path: str) -> Dungeon:
+        with open(path, "rb") as file:
+            return DungeonFile.load_file(file)
+
+    @staticmethod
+    def load_file(file: BinaryIO) -> Dungeon:
+        # copy-on-write mapping: tiles and fog of war are used in place and only pages the game modifies get copied
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+        return DungeonFile._load(memoryview(buffer))
+
+    @staticmethod
+    def _load(buffer: memoryview) -> Dungeon:
+        if len(buffer) < DungeonFile.HEADER.size:
+            raise DungeonFormatError("File is too short")
+        magic, version, _, width, height, seed, hero_x, hero_y, objects_count, monsters_count = \
+            DungeonFile.HEADER.unpack_from(buffer)
+        if magic != DungeonFile.MAGIC:
+            raise DungeonFormatError("Not a dungeon file")
+        if version != DungeonFile.VERSION:
+            raise DungeonFormatError("Unsupported dungeon file version {}".format(version))
+        cells = width * height
+        tiles_offset = DungeonFile.HEADER.size
+        fog_offset = tiles_offset + cells
+        entities_offset = fog_offset + (width + 7) // 8 * height
+        entities_end = entities_offset + (objects_count + monsters_count) * DungeonFile.ENTITY.size
+        if len(buffer) < entities_end:
+            raise DungeonFormatError("File is truncated")
+        tiles = buffer[tiles_offset:fog_offset].cast(Grid.TYPECODE)
+        fog_of_war = buffer[fog_offset:entities_offset]
+        entities = list(DungeonFile.ENTITY.iter_unpack(buffer[entities_offset:entities_end]))
+        return Dungeon.restore(
+            seed,
+            Grid(width, height, data=tiles),
+            BitGrid(width, height, data=fog_of_war),
+            (hero_x, hero_y),
+            entities[:objects_count],
+            entities[objects_count:]
+        )
+
+
+if __name__ == '__main__':
+    # round trip check: everything pack() holds, entity flags included, survives save and load
+    original = Dungeon(64, 64, seed=1)
+    original.add_monster(*original.hero_position().tup(), Tiles.MON_BAT, flags=0b110)
+    restored = DungeonFile.loads(DungeonFile.dumps(original))
+    assert restored.pack() == original.pack(), "round trip changed the dungeon"
+    print("ok: {} bytes".format(len(DungeonFile.dumps(original))))
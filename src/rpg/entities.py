@@ -0,0 +1,117 @@
+from __future__ import annotations
+from array import array
+from typing import Iterator
+from rpg.utils import Bounded, SpatialIndex
+
+
+class EntityStore:
+    # entities of one kind as parallel typed arrays indexed by slot; removed slots are reused from a free list
+    # and their generation is bumped, so handles to a removed entity can be told apart from its successor
+    FLAG_ALIVE = 1
+
+    def __init__(self, chunk_size: int = SpatialIndex.DEFAULT_CHUNK_SIZE) -> None:
+        self._x = array('l')
+        self._y = array('l')
+        self._type = array('B')
+        self._flags = array('B')
+        self._generation = array('L')
+        self._free = list()
+        # the index holds slots, so queries do not create objects
+        self._index = SpatialIndex(chunk_size)
+
+    def add(self, x: int, y: int, type_id: int, flags: int = 0) -> int:
+        flags |= EntityStore.FLAG_ALIVE
+        if self._free:
+            slot = self._free.pop()
+            self._x[slot], self._y[slot], self._type[slot], self._flags[slot] = x, y, type_id, flags
+        else:
+            slot = len(self._x)
+            self._x.append(x)
+            self._y.append(y)
+            self._type.append(type_id)
+            self._flags.append(flags)
+            self._generation.append(0)
+        self._index.add(slot, x, y)
+        return slot
+
+    def remove(self, slot: int) -> None:
+        if not self.alive(slot):
+            raise ValueError("Slot {} is not in use".format(slot))
+        self._index.remove(slot, self._x[slot], self._y[slot])
+        self._flags[slot] = 0
+        self._generation[slot] = (self._generation[slot] + 1) & 0xFFFFFFFF
+        self._free.append(slot)
+
+    def move(self, slot: int, dx: int, dy: int) -> None:
+        old_x, old_y = self._x[slot], self._y[slot]
+        self._x[slot] = old_x + dx
+        self._y[slot] = old_y + dy
+        self._index.move(slot, old_x, old_y, old_x + dx, old_y + dy)
+
+    def alive(self, slot: int) -> bool:
+        return 0 <= slot < len(self._flags) and self._flags[slot] & EntityStore.FLAG_ALIVE != 0
+
+    def generation(self, slot: int) -> int:
+        return self._generation[slot]
+
+    def position(self, slot: int) -> tuple:
+        return self._x[slot], self._y[slot]
+
+    def type(self, slot: int) -> int:
+        return self._type[slot]
+
+    def flags(self, slot: int) -> int:
+        return self._flags[slot]
+
+    def set_flags(self, slot: int, flags: int) -> None:
+        self._flags[slot] = flags | EntityStore.FLAG_ALIVE
+
+    def slots(self) -> Iterator[int]:
+        flags = self._flags
+        return (slot for slot in range(len(flags)) if flags[slot] & EntityStore.FLAG_ALIVE)
+
+    def entities(self) -> Iterator[tuple]:
+        # (x, y, type, flags) of every live entity in slot order
+        xs, ys, types, flags = self._x, self._y, self._type, self._flags
+        return ((xs[slot], ys[slot], types[slot], flags[slot]) for slot in self.slots())
+
+    def at(self, x: int, y: int) -> list:
+        return self._index.at(x, y)
+
+    def query(self, area: Bounded) -> Iterator[tuple]:
+        # (x, y, slot) of every entity inside the area
+        return self._index.query(area)
+
+    def types_in(self, area: Bounded) -> Iterator[tuple]:
+        # (x, y, type) of every entity inside the area, for renderers
+        types = self._type
+        return ((x, y, types[slot]) for x, y, slot in self._index.query(area))
+
+    def columns(self) -> tuple:
+        # the raw x, y, type and flags arrays for batch scans, dead slots have no FLAG_ALIVE
+        return self._x, self._y, self._type, self._flags
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+class EntityHandle:
+    __slots__ = ("_store", "_slot", "_generation")
+
+    def __init__(self, store: EntityStore, slot: int) -> None:
+        self._store = store
+        self._slot = slot
+        self._generation = store.generation(slot)
+
+    def slot(self) -> int:
+        return self._slot
+
+    def valid(self) -> bool:
+        return self._store.alive(self._slot) and self._store.generation(self._slot) == self._generation
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, EntityHandle) and self._store is other._store and \
+            self._slot == other._slot and self._generation == other._generation
+
+    def __hash__(self) -> int:
+        return hash((id(self._store), self._slot, self._generation))
@@ -0,0 +1,83 @@
+from __future__ import annotations
+from math import isqrt
+from typing import Callable
+from rpg.utils import Grid
+
+
+class FieldOfView:
+    # octant transforms (xx, xy, yx, yy) for recursive shadowcasting
+    OCTANTS = (
+        (1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1),
+        (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1),
+    )
+
+    def __init__(self, opaque: tuple, light: Callable[[int], float]) -> None:
+        self._opaque = Grid.lookup_table(dict.fromkeys(opaque, True), False)
+        self._light = light
+        self._key = None
+        self._light_map = dict()
+
+    def compute(self, grid: Grid, origin_x: int, origin_y: int, radius: int, left: int = 0, top: int = 0) -> dict:
+        # grid is a window of the map with its top left corner at (left, top), the light map uses map coordinates;
+        # terrain does not change, so the result is memoized until the origin, radius or window moves
+        key = (origin_x, origin_y, radius, left, top, grid.width(), grid.height())
+        if key == self._key:
+            return self._light_map
+        light_map = {(origin_x, origin_y): 1.0}
+        for xx, xy, yx, yy in FieldOfView.OCTANTS:
+            self._cast(grid, left, top, light_map, origin_x, origin_y, radius, 1, 1.0, 0.0, xx, xy, yx, yy)
+        self._key = key
+        self._light_map = light_map
+        return light_map
+
+    def light_map(self) -> dict:
+        return self._light_map
+
+    def is_visible(self, x: int, y: int) -> bool:
+        return (x, y) in self._light_map
+
+    def light(self, x: int, y: int, default: float = 0.0) -> float:
+        return self._light_map.get((x, y), default)
+
+    def _cast(self, grid: Grid, left: int, top: int, light_map: dict, origin_x: int, origin_y: int, radius: int,
+              row: int, start: float, end: float, xx: int, xy: int, yx: int, yy: int) -> None:
+        if start < end:
+            return
+        width, height = grid.width(), grid.height()
+        data = grid.raw()
+        opaque = self._opaque
+        light = self._light
+        radius_squared = radius * radius
+        new_start = 0.0
+        for distance in range(row, radius + 1):
+            dx, dy = -distance - 1, -distance
+            blocked = False
+            while dx <= 0:
+                dx += 1
+                left_slope = (dx - 0.5) / (dy + 0.5)
+                right_slope = (dx + 0.5) / (dy - 0.5)
+                if start < right_slope:
+                    continue
+                if end > left_slope:
+                    break
+                x = origin_x + dx * xx + dy * xy - left
+                y = origin_y + dx * yx + dy * yy - top
+                # cells outside the grid block the view
+                inside = 0 <= x < width and 0 <= y < height
+                squared = dx * dx + dy * dy
+                if inside and squared <= radius_squared:
+                    light_map[(x + left, y + top)] = light(isqrt(squared))
+                is_opaque = not inside or opaque[data[y * width + x]]
+                if blocked:
+                    if is_opaque:
+                        new_start = right_slope
+                    else:
+                        blocked = False
+                        start = new_start
+                elif is_opaque and distance < radius:
+                    blocked = True
+                    self._cast(grid, left, top, light_map, origin_x, origin_y, radius, distance + 1,
+                               start, left_slope, xx, xy, yx, yy)
+                    new_start = right_slope
+            if blocked:
+                break
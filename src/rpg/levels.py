@@ -0,0 +1,162 @@
+from __future__ import annotations
+import os
+import queue
+import random
+import multiprocessing
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Union
+from rpg.dungeon import Dungeon, generate_packed
+from rpg.dungeon_cache import generate_packed_cached
+from rpg.world import ChunkedDungeon
+
+
+def _lower_priority(increment: int) -> None:
+    # process pool initializer: background generation should yield the CPU to the game
+    try:
+        os.nice(increment)
+    except (AttributeError, OSError):
+        pass
+
+
+def _close_level(level) -> None:
+    # chunked worlds own a directory of page files
+    if isinstance(level, ChunkedDungeon):
+        level.close()
+
+
+def _close_result(future: Future) -> None:
+    # done callback of a job whose level is no longer wanted
+    if not future.cancelled() and future.exception() is None:
+        _close_level(future.result())
+
+
+class LevelManager:
+    # levels below the requested depth are generated ahead of time, in the order they will be needed
+    PREFETCH_LEVELS = 2
+    NICE_INCREMENT = 10
+
+    class Job:
+
+        def __init__(self, future: Future, progress_queue) -> None:
+            self.future = future
+            self.queue = progress_queue
+            self.progress = 0
+
+    def __init__(self, width: int, height: int, seed: int = None, prefetch: int = PREFETCH_LEVELS,
+                 nice: int = NICE_INCREMENT, use_processes: bool = True, cache_directory: str = None,
+                 world_size: tuple = None) -> None:
+        if seed is None:
+            seed = random.randrange(1 << 32)
+        self._width = width
+        self._height = height
+        self._seed = seed
+        self._prefetch = prefetch
+        self._cache_directory = cache_directory
+        self._world_size = world_size
+        # chunked worlds page to disk from the process that plays them, they are built in a thread
+        # and only their chunks are generated in a worker process
+        self._use_processes = use_processes and world_size is None
+        self._chunk_processes = use_processes
+        self._nice = nice
+        self._executor = None
+        self._chunk_executor = None
+        self._manager = None
+        self._jobs = dict()
+        self._levels = dict()
+
+    def _start_executor(self) -> Executor:
+        if self._executor is None:
+            if self._use_processes:
+                self._manager = multiprocessing.Manager()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=1, initializer=_lower_priority, initargs=(self._nice,))
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=1)
+        return self._executor
+
+    def _start_chunk_executor(self) -> Executor:
+        # separate from the level executor: a chunk the hero walks into must not queue behind whole levels
+        if self._chunk_executor is None:
+            if self._chunk_processes:
+                self._chunk_executor = ProcessPoolExecutor(
+                    max_workers=1, initializer=_lower_priority, initargs=(self._nice,))
+            else:
+                self._chunk_executor = ThreadPoolExecutor(max_workers=1)
+        return self._chunk_executor
+
+    def level_seed(self, depth: int) -> int:
+        return random.Random("{}:level:{}".format(self._seed, depth)).randrange(1 << 32)
+
+    def _submit(self, depth: int) -> LevelManager.Job:
+        executor = self._start_executor()
+        seed = self.level_seed(depth)
+        progress_queue = self._manager.Queue() if self._use_processes else queue.Queue()
+        if self._world_size is not None:
+            future = executor.submit(
+                ChunkedDungeon, *self._world_size, seed=seed, executor=self._start_chunk_executor())
+        elif self._cache_directory is not None:
+            future = executor.submit(
+                generate_packed_cached, self._cache_directory, self._width, self._height, progress_queue, seed)
+        else:
+            future = executor.submit(generate_packed, self._width, self._height, progress_queue, seed)
+        return LevelManager.Job(future, progress_queue)
+
+    def request(self, depth: int) -> None:
+        # the player is about to play this depth: make sure it and the next levels are on their way
+        # and cancel everything that was scheduled for the levels left behind
+        for old_depth in [d for d in self._jobs if d < depth]:
+            self.cancel(old_depth)
+        for old_depth in [d for d in self._levels if d < depth]:
+            _close_level(self._levels.pop(old_depth))
+        for next_depth in range(depth, depth + self._prefetch + 1):
+            if next_depth not in self._jobs and next_depth not in self._levels:
+                self._jobs[next_depth] = self._submit(next_depth)
+
+    def cancel(self, depth: int) -> None:
+        # queued jobs are dropped, a running one finishes in the background and its result is ignored
+        job = self._jobs.pop(depth, None)
+        if job is not None and not job.future.cancel():
+            job.future.add_done_callback(_close_result)
+
+    def progress(self, depth: int) -> int:
+        if depth in self._levels:
+            return 100
+        job = self._jobs.get(depth)
+        if job is None:
+            return 0
+        try:
+            while True:
+                job.progress = job.queue.get_nowait()
+        except queue.Empty:
+            pass
+        return job.progress
+
+    def level(self, depth: int) -> Optional[Union[Dungeon, ChunkedDungeon]]:
+        # never blocks: returns None while the level is still being generated
+        if depth in self._levels:
+            return self._levels[depth]
+        job = self._jobs.get(depth)
+        if job is None or not job.future.done():
+            return None
+        del self._jobs[depth]
+        result = job.future.result()
+        level = Dungeon.unpack(result) if isinstance(result, tuple) else result
+        self._levels[depth] = level
+        return level
+
+    def shutdown(self) -> None:
+        for depth in list(self._jobs):
+            self.cancel(depth)
+        for level in self._levels.values():
+            _close_level(level)
+        self._levels.clear()
+        if self._executor is not None:
+            # the running job still holds a proxy to the manager queue, let it finish first
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        if self._chunk_executor is not None:
+            self._chunk_executor.shutdown(wait=True, cancel_futures=True)
+            self._chunk_executor = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
@@ -1,15 +1,15 @@
-from rpg.scene import MovableGameObject
-from rpg.utils import Point
+from rpg.objects import MovableGameObject
+from rpg.dungeon import Dungeon
 
 
 class Hero(MovableGameObject):
+    # points are immutable, the dungeon keeps the one position of the hero that the map and monsters use
 
-    def __init__(self, position: Point):
-        self._position = position
+    def __init__(self, dungeon: Dungeon):
+        self._dungeon = dungeon
 
     def position(self) -> tuple:
-        return self._position.tup()
+        return self._dungeon.hero_position().tup()
 
     def move(self, dx: int = 0, dy: int = 0) -> None:
-        self._position.x += dx
-        self._position.y += dy
+        self._dungeon.move_hero(dx, dy)
@@ -1,15 +1,13 @@
-from rpg.scene import GameObject
+from rpg.objects import GameObject
+from rpg.entities import EntityHandle
 
 
-class Loot(GameObject):
-
-    def __init__(self, x: int, y: int, type_id: int):
-        self._x = x
-        self._y = y
-        self._type_id = type_id
+class Loot(EntityHandle, GameObject):
+    # a handle to a slot of the dungeon's loot store
+    __slots__ = ()
 
     def position(self) -> tuple:
-        return self._x, self._y
+        return self._store.position(self._slot)
 
     def type(self) -> int:
-        return self._type_id
+        return self._store.type(self._slot)
@@ -1,19 +1,16 @@
-from rpg.scene import MovableGameObject
+from rpg.objects import MovableGameObject
+from rpg.entities import EntityHandle
 
 
-class Monster(MovableGameObject):
-
-    def __init__(self, x: int, y: int, type_id: int) -> None:
-        self._x = x
-        self._y = y
-        self._type = type_id
+class Monster(EntityHandle, MovableGameObject):
+    # a handle to a slot of the dungeon's monster store, moving it keeps the store's index up to date
+    __slots__ = ()
 
     def position(self) -> tuple:
-        return self._x, self._y
+        return self._store.position(self._slot)
 
     def move(self, dx: int = 0, dy: int = 0) -> None:
-        self._x += dx
-        self._y += dy
+        self._store.move(self._slot, dx, dy)
 
     def type(self):
-        return self._type
+        return self._store.type(self._slot)
@@ -0,0 +1,12 @@
+class GameObject:
+    __slots__ = ()
+
+    def position(self) -> tuple:
+        pass
+
+
+class MovableGameObject(GameObject):
+    __slots__ = ()
+
+    def move(self, dx: int = 0, dy: int = 0) -> None:
+        pass
@@ -0,0 +1,224 @@
+from __future__ import annotations
+from array import array
+from heapq import heappush as push, heappop as pop
+from typing import Iterable
+from rpg.utils import Grid, GridWatcher
+
+
+class RegionGraph(GridWatcher):
+    # HPA* style abstraction of the map: walkable cells are clustered by tile class (rooms, doors, corridors,
+    # caves) and by square blocks, clusters are joined by portal nodes placed on their common borders and
+    # the costs between the portals of a cluster are computed once and cached
+    BLOCK_SIZE = 16
+    # long borders get a portal every this many crossing cells
+    PORTAL_SPACING = 64
+    STRAIGHT_COST = 10
+    DIAGONAL_COST = 14
+    NO_CLUSTER = -1
+
+    def __init__(self, grid: Grid, classes: Iterable[Iterable[int]], block_size: int = BLOCK_SIZE) -> None:
+        self._grid = grid
+        self._block_size = block_size
+        # 0 is not walkable
+        self._classes = Grid.lookup_table({tile: number for number, tiles in enumerate(classes, 1) for tile in tiles})
+        self._cluster = None
+        self._portals = list()
+        self._edges = dict()
+        self._expanded = 0
+
+    def attach(self) -> RegionGraph:
+        self._grid.watch(self)
+        return self
+
+    def detach(self) -> None:
+        self._grid.unwatch(self)
+
+    def expanded(self) -> int:
+        # abstract nodes and cluster cells popped so far, graph builds included
+        return self._expanded
+
+    def changed(self, left: int, top: int, right: int, bottom: int) -> None:
+        # rebuilt on the next query
+        self._cluster = None
+
+    def _neighbours(self, index: int) -> Iterable[tuple]:
+        # (neighbour index, step cost) of the walkable cells around a cell
+        width, height = self._grid.width(), self._grid.height()
+        data = self._grid.raw()
+        classes = self._classes
+        x, y = index % width, index // width
+        for ny in range(max(y - 1, 0), min(y + 2, height)):
+            for nx in range(max(x - 1, 0), min(x + 2, width)):
+                neighbour = ny * width + nx
+                if neighbour != index and classes[data[neighbour]]:
+                    yield neighbour, RegionGraph.DIAGONAL_COST if nx != x and ny != y else RegionGraph.STRAIGHT_COST
+
+    def _build(self) -> None:
+        width, height = self._grid.width(), self._grid.height()
+        data = self._grid.raw()
+        classes = self._classes
+        block_size = self._block_size
+        cluster = array('l', [RegionGraph.NO_CLUSTER]) * (width * height)
+        members = list()
+        # clusters are 8-connected cells of one class within one block
+        for index in range(width * height):
+            if cluster[index] != RegionGraph.NO_CLUSTER or not classes[data[index]]:
+                continue
+            number = len(members)
+            kind = classes[data[index]]
+            block = (index % width // block_size, index // width // block_size)
+            cluster[index] = number
+            cells = [index]
+            stack = [index]
+            while stack:
+                current = stack.pop()
+                for neighbour, _ in self._neighbours(current):
+                    if cluster[neighbour] == RegionGraph.NO_CLUSTER and classes[data[neighbour]] == kind and \
+                            (neighbour % width // block_size, neighbour // width // block_size) == block:
+                        cluster[neighbour] = number
+                        cells.append(neighbour)
+                        stack.append(neighbour)
+            members.append(cells)
+        self._cluster = cluster
+
+        # every pair of touching clusters gets one portal per PORTAL_SPACING crossings
+        crossings = dict()
+        for cells in members:
+            for index in cells:
+                own = cluster[index]
+                for neighbour, cost in self._neighbours(index):
+                    other = cluster[neighbour]
+                    if own < other:
+                        crossings.setdefault((own, other), []).append((index, neighbour, cost))
+        self._portals = [set() for _ in members]
+        self._edges = dict()
+        for (own, other), pairs in crossings.items():
+            pairs.sort()
+            count = 1 + len(pairs) // RegionGraph.PORTAL_SPACING
+            for number in range(count):
+                index, neighbour, cost = pairs[(2 * number + 1) * len(pairs) // (2 * count)]
+                self._portals[own].add(index)
+                self._portals[other].add(neighbour)
+                self._edges.setdefault(index, dict())[neighbour] = cost
+                self._edges.setdefault(neighbour, dict())[index] = cost
+
+        # intra-cluster costs between the portals of every cluster
+        for portals in self._portals:
+            for portal in portals:
+                costs, _ = self._search(portal)
+                edges = self._edges[portal]
+                for other in portals:
+                    if other != portal and other in costs:
+                        edges[other] = min(edges.get(other, costs[other]), costs[other])
+
+    def _search(self, start: int) -> tuple:
+        # dijkstra restricted to the cluster of the start cell, returns costs and parents
+        cluster = self._cluster
+        own = cluster[start]
+        costs = {start: 0}
+        parents = {start: -1}
+        frontier = [(0, start)]
+        while frontier:
+            cost, current = pop(frontier)
+            if cost > costs[current]:
+                continue
+            self._expanded += 1
+            for neighbour, step in self._neighbours(current):
+                if cluster[neighbour] != own:
+                    continue
+                new_cost = cost + step
+                if neighbour not in costs or new_cost < costs[neighbour]:
+                    costs[neighbour] = new_cost
+                    parents[neighbour] = current
+                    push(frontier, (new_cost, neighbour))
+        return costs, parents
+
+    def _distance(self, a: int, b: int) -> int:
+        width = self._grid.width()
+        dx, dy = abs(a % width - b % width), abs(a // width - b // width)
+        return RegionGraph.STRAIGHT_COST * abs(dx - dy) + RegionGraph.DIAGONAL_COST * min(dx, dy)
+
+    def cluster(self, x: int, y: int) -> int:
+        if self._cluster is None:
+            self._build()
+        return self._cluster[y * self._grid.width() + x]
+
+    def portal_count(self) -> int:
+        if self._cluster is None:
+            self._build()
+        return len(self._edges)
+
+    def route(self, start: tuple, goal: tuple) -> list:
+        # waypoints from start to goal on the abstract graph, both included; empty when the goal is unreachable
+        if self._cluster is None:
+            self._build()
+        width = self._grid.width()
+        start_index = start[1] * width + start[0]
+        goal_index = goal[1] * width + goal[0]
+        cluster = self._cluster
+        if cluster[start_index] == RegionGraph.NO_CLUSTER or cluster[goal_index] == RegionGraph.NO_CLUSTER:
+            return []
+        # start and goal are linked to the portals of their clusters for this query only
+        start_costs, _ = self._search(start_index)
+        if goal_index in start_costs:
+            return [start, goal]
+        goal_costs, _ = self._search(goal_index)
+        goal_portals = {portal: goal_costs[portal] for portal in self._portals[cluster[goal_index]]
+                        if portal in goal_costs}
+        start_edges = dict(self._edges.get(start_index, {}))
+        for portal in self._portals[cluster[start_index]]:
+            if portal in start_costs:
+                start_edges[portal] = start_costs[portal]
+        straight, diagonal = RegionGraph.STRAIGHT_COST, RegionGraph.DIAGONAL_COST
+        goal_x, goal_y = goal
+        frontier = [(self._distance(start_index, goal_index), 0, start_index)]
+        came_from = {start_index: -1}
+        cost_so_far = {start_index: 0}
+        closed = set()
+        while frontier:
+            _, current_cost, current = pop(frontier)
+            if current in closed:
+                continue
+            if current == goal_index:
+                path = list()
+                while current >= 0:
+                    path.append((current % width, current // width))
+                    current = came_from[current]
+                path.reverse()
+                return path
+            closed.add(current)
+            self._expanded += 1
+            edges = start_edges if current == start_index else self._edges.get(current, {})
+            if current in goal_portals:
+                edges = dict(edges)
+                edges[goal_index] = goal_portals[current]
+            for neighbour, cost in edges.items():
+                if neighbour in closed:
+                    continue
+                new_cost = current_cost + cost
+                if new_cost < cost_so_far.get(neighbour, new_cost + 1):
+                    cost_so_far[neighbour] = new_cost
+                    came_from[neighbour] = current
+                    dx, dy = abs(neighbour % width - goal_x), abs(neighbour // width - goal_y)
+                    if dx < dy:
+                        dx, dy = dy, dx
+                    push(frontier, (new_cost + straight * (dx - dy) + diagonal * dy, new_cost, neighbour))
+        return []
+
+    def refine(self, start: tuple, waypoint: tuple) -> list:
+        # tile level cells from start to the next waypoint of a route, both included
+        if self._cluster is None:
+            self._build()
+        width = self._grid.width()
+        start_index = start[1] * width + start[0]
+        current = waypoint[1] * width + waypoint[0]
+        _, parents = self._search(start_index)
+        if current not in parents:
+            # the waypoint is the portal across the border of the start cluster
+            return [start, waypoint]
+        path = list()
+        while current >= 0:
+            path.append((current % width, current // width))
+            current = parents[current]
+        path.reverse()
+        return path
@@ -1,19 +1,42 @@
+from typing import Optional
 from pygame import Surface
 from rpg.scene import SceneObject
 from rpg.scene_progress import SceneProgress
+from rpg.levels import LevelManager
+from rpg.dungeon_cache import DungeonCache
 
 
 class RPG(SceneObject):
+    DUNGEON_SIZE = (256, 256)
+    # generation is pure python CPU work, so in a thread it competes with rendering for the GIL
+    USE_PROCESS_POOL = True
+    # a fixed seed makes the levels reproducible and lets them be served from the on-disk cache
+    SEED = None
+    CACHE_DIRECTORY = DungeonCache.DEFAULT_DIRECTORY
+    # set to a (width, height) tuple to play chunked worlds streamed around the hero instead
+    WORLD_SIZE = None
 
     def __init__(self, w: int, h: int) -> None:
-        self._scene = SceneProgress(w, h)
+        self._levels = LevelManager(
+            *RPG.DUNGEON_SIZE,
+            seed=RPG.SEED,
+            use_processes=RPG.USE_PROCESS_POOL,
+            cache_directory=RPG.CACHE_DIRECTORY if RPG.SEED is not None else None,
+            world_size=RPG.WORLD_SIZE
+        )
+        self._scene = SceneProgress(w, h, self._levels)
 
     def update(self) -> None:
-        if self._scene.is_finished():
+        # a prefetched level finishes the progress scene at once, so scenes may switch more than once
+        while self._scene.is_finished():
             next_scene = self._scene.next_scene()
-            if next_scene is not None:
-                self._scene = next_scene
+            if next_scene is None:
+                break
+            self._scene = next_scene
         self._scene.update()
 
-    def render(self, surface: Surface) -> None:
-        self._scene.render(surface)
+    def shutdown(self) -> None:
+        self._levels.shutdown()
+
+    def render(self, surface: Surface) -> Optional[list]:
+        return self._scene.render(surface)
@@ -1,17 +1,11 @@
 from __future__ import annotations
-from pygame import Surface, image, BLEND_RGBA_SUB
-
-
-class GameObject:
-
-    def position(self) -> tuple:
-        pass
-
-
-class MovableGameObject(GameObject):
-
-    def move(self, dx: int = 0, dy: int = 0) -> None:
-        pass
+import os
+from collections import OrderedDict
+from typing import Optional
+from pygame import Surface, image, display, BLEND_RGBA_SUB
+# game objects live in a module without pygame, so the dungeon can be generated without it;
+# they are re-exported here for the code that still imports them from rpg.scene
+from rpg.objects import GameObject, MovableGameObject  # noqa: F401
 
 
 class SceneObject:
@@ -19,7 +13,8 @@ class SceneObject:
     def update(self) -> None:
         pass
 
-    def render(self, surface: Surface) -> None:
+    def render(self, surface: Surface) -> Optional[list]:
+        # returns the dirty rectangles to update on screen, None means the whole surface
         pass
 
 
@@ -33,11 +28,20 @@ class AbstractScene(SceneObject):
 
 
 class SpriteSheet:
-    IMAGE = image.load("art/spritesheet.png")
+    # resolved from the source tree, not from the working directory
+    IMAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "art", "spritesheet.png")
+    # shaded tiles are cached per quantized brightness level
+    BRIGHTNESS_LEVELS = 32
+    CACHE_SIZE = 1024
+
+    _image = None
+    _converted = None
 
     def __init__(self, tile_width: int = 16, tile_height: int = 16):
         self._tile_width = tile_width
         self._tile_height = tile_height
+        self._tiles = dict()
+        self._shaded = OrderedDict()
 
     def tile_width(self) -> int:
         return self._tile_width
@@ -45,18 +49,55 @@ class SpriteSheet:
     def tile_height(self) -> int:
         return self._tile_height
 
+    @staticmethod
+    def image() -> Surface:
+        # the sheet is decoded on first use, importing the scenes does not touch the art
+        if SpriteSheet._image is None:
+            SpriteSheet._image = image.load(SpriteSheet.IMAGE_PATH)
+        return SpriteSheet._image
+
+    @staticmethod
+    def _sheet() -> Surface:
+        # converting needs an initialized display, so it is postponed to the first draw
+        if SpriteSheet._converted is None:
+            if display.get_surface() is None:
+                return SpriteSheet.image()
+            SpriteSheet._converted = SpriteSheet.image().convert_alpha()
+        return SpriteSheet._converted
+
+    def _tile(self, tile_row: int, tile_col: int) -> Surface:
+        key = (tile_row, tile_col)
+        tile = self._tiles.get(key)
+        if tile is None:
+            sheet = SpriteSheet._sheet()
+            src = (self._tile_width * tile_col, self._tile_height * tile_row, self._tile_width, self._tile_height)
+            tile = sheet.subsurface(src)
+            if sheet is SpriteSheet._converted:
+                self._tiles[key] = tile
+        return tile
+
+    def _shaded_tile(self, tile_row: int, tile_col: int, level: int) -> Surface:
+        key = (tile_row, tile_col, level)
+        tile = self._shaded.get(key)
+        if tile is not None:
+            self._shaded.move_to_end(key)
+            return tile
+        tile = self._tile(tile_row, tile_col).copy()
+        color_level = 255 - int(round(255.0 * level / SpriteSheet.BRIGHTNESS_LEVELS))
+        tile.fill((color_level, color_level, color_level, 0), special_flags=BLEND_RGBA_SUB)
+        # like in _tile, copies of the unconverted sheet would stay slow to blit, they are not kept
+        if SpriteSheet._converted is not None:
+            self._shaded[key] = tile
+            if len(self._shaded) > SpriteSheet.CACHE_SIZE:
+                self._shaded.popitem(last=False)
+        return tile
+
     def draw(self, surface: Surface, tile_row: int, tile_col: int, x: int, y: int, brightness: float = 1.0) -> None:
-        _brightness = int(round(brightness * 1000.0))
-        if _brightness == 0:
+        level = int(round(brightness * SpriteSheet.BRIGHTNESS_LEVELS))
+        if level <= 0:
             return
-        dst = (x * self._tile_width, y * self._tile_height, self._tile_width, self._tile_height)
-        src = (self._tile_width * tile_col, self._tile_height * tile_row, self._tile_width, self._tile_height)
-        # draw tile
-        surface.blit(SpriteSheet.IMAGE, dst, src)
-        if _brightness != 1000:
-            # apply color mask
-            color_level = 255 - int(round(255.0 * brightness))
-            if color_level < 0:
-                color_level = 0
-            color_mask = (color_level, color_level, color_level, 0)
-            surface.fill(color_mask, dst, special_flags=BLEND_RGBA_SUB)
+        dst = (x * self._tile_width, y * self._tile_height)
+        if level >= SpriteSheet.BRIGHTNESS_LEVELS:
+            surface.blit(self._tile(tile_row, tile_col), dst)
+        else:
+            surface.blit(self._shaded_tile(tile_row, tile_col, level), dst)
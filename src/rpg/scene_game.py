@@ -1,31 +1,70 @@
-from pygame import Surface, key, K_LEFT, K_RIGHT, K_UP, K_DOWN, time
+from typing import Callable
+from pygame import Surface, key, K_LEFT, K_RIGHT, K_UP, K_DOWN, K_PAGEDOWN
 from rpg.scene import AbstractScene, SpriteSheet
 from rpg.dungeon import Dungeon, Tiles
+from rpg.levels import LevelManager
 from rpg.obj_hero import Hero
-from rpg.utils import Rect, Point
+from rpg.fov import FieldOfView
+from rpg.utils import Rect
 
 
 class SceneGame(AbstractScene):
+    # visited tiles out of the hero's sight
+    REMEMBERED_BRIGHTNESS = 0.6
 
-    def __init__(self, dungeon: Dungeon, width: int, height: int):
+    def __init__(self, dungeon: Dungeon, width: int, height: int, controls: Callable[[], tuple] = None,
+                 levels: LevelManager = None, depth: int = 0, descend: Callable[[], bool] = None):
         self._dungeon = dungeon
-        self._hero = Hero(dungeon.hero_position())
+        self._controls = controls if controls is not None else SceneGame.keyboard_controls
+        self._levels = levels
+        self._depth = depth
+        self._descend = descend if descend is not None else SceneGame.keyboard_descend
+        # the key that brought the hero here has to be released before it works again
+        self._descend_armed = False
+        self._descending = False
+        self._hero = Hero(dungeon)
         self._width = width
         self._height = height
         self._sprites = SpriteSheet()
-        self._clock = time.Clock()
+        self._layer = None
+        self._layer_key = None
+        self._brightness = dict()
+        self._sprites_drawn = dict()
+        self._fov = FieldOfView(Dungeon.STOP_TILES, self._calc_distance_brightness)
 
     def is_finished(self) -> bool:
-        return False
+        return self._descending
 
     def next_scene(self) -> AbstractScene:
-        raise NotImplemented
+        depth = self._depth + 1
+        level = self._levels.level(depth)
+        if level is not None:
+            # prefetched in the background, no loading screen
+            self._levels.request(depth)
+            return SceneGame(level, self._width, self._height, self._controls, self._levels, depth, self._descend)
+        # imported here, the progress scene itself starts the game scene
+        from rpg.scene_progress import SceneProgress
+        return SceneProgress(self._width, self._height, self._levels, depth)
 
     def update(self) -> None:
+        # one call is one game tick, the rate is set by the scheduler in game.py
         super().update()
 
-        self._clock.tick(10)
+        if self._levels is not None:
+            if not self._descend():
+                self._descend_armed = True
+            elif self._descend_armed:
+                self._descending = True
+                return
 
+        hero_dx, hero_dy = self._controls()
+        if self._dungeon.is_movement_possible(*self._hero.position(), hero_dx, hero_dy):
+            self._hero.move(hero_dx, hero_dy)
+            self._dungeon.update_visible()
+        self._dungeon.move_monsters()
+
+    @staticmethod
+    def keyboard_controls() -> tuple:
         hero_dx, hero_dy = 0, 0
         pressed_keys = key.get_pressed()
         if pressed_keys[K_LEFT]:
@@ -36,16 +75,17 @@ class SceneGame(AbstractScene):
             hero_dy = -1
         if pressed_keys[K_DOWN]:
             hero_dy = 1
+        return hero_dx, hero_dy
 
-        if self._dungeon.is_movement_possible(*self._hero.position(), hero_dx, hero_dy):
-            self._hero.move(hero_dx, hero_dy)
-            self._dungeon.update_visible()
+    @staticmethod
+    def keyboard_descend() -> bool:
+        return key.get_pressed()[K_PAGEDOWN]
 
-    def render(self, surface: Surface) -> None:
+    def render(self, surface: Surface) -> list:
         super().render(surface)
-        self._render_map(surface, *self._hero.position())
+        return self._render_map(surface, *self._hero.position())
 
-    def _render_map(self, surface: Surface, hero_x: int, hero_y: int):
+    def _viewport(self, hero_x: int, hero_y: int) -> tuple:
         width = self._width // self._sprites.tile_width()
         height = self._height // self._sprites.tile_height()
 
@@ -57,57 +97,85 @@ class SceneGame(AbstractScene):
         if start_y + height > self._dungeon.height():
             start_y -= (start_y + height - self._dungeon.height())
 
+        return start_x, start_y, width, height
+
+    def _render_layer(self, start_x: int, start_y: int, width: int, height: int, hero_x: int, hero_y: int) -> None:
+        # visited terrain only changes when the hero moves or the fog of war is lifted
+        if self._layer is None:
+            self._layer = Surface((self._width, self._height)).convert()
+        self._layer.fill((0, 0, 0))
+        self._brightness = dict()
         map_area = self._dungeon.area(Rect(start_x, start_y, width, height))
+        # the light map covers the whole viewport and is only recomputed when the hero moves
+        radius = max(hero_x - start_x, start_x + width - hero_x) + max(hero_y - start_y, start_y + height - hero_y)
+        light_map = self._fov.compute(map_area, hero_x, hero_y, radius, start_x, start_y)
         for y, row in enumerate(map_area):
             for x, cell in enumerate(row):
                 real_x, real_y = start_x + x, start_y + y
                 if not self._dungeon.is_visited(real_x, real_y):
                     continue
-                brightness = self._calc_tile_brightness(real_x, real_y, hero_x, hero_y)
+                brightness = light_map.get((real_x, real_y), SceneGame.REMEMBERED_BRIGHTNESS)
+                self._brightness[(x, y)] = brightness
                 # rendering map tiles
                 if cell in Tiles.SPRITE_TILE.keys():
-                    self._sprites.draw(surface, *Tiles.SPRITE_TILE[cell], x, y, brightness=brightness)
-                # render map objects
-                self._render_map_objects(surface, real_x, real_y, x, y, brightness)
-                self._render_map_monsters(surface, real_x, real_y, x, y, brightness)
-                # render hero
-                if real_x == hero_x and real_y == hero_y:
-                    self._sprites.draw(surface, 0, 4, x, y, 1.0)
-
-    def _render_map_objects(self, surface: Surface, obj_x: int, obj_y: int, x: int, y: int, brightness: float) -> None:
-        for loot in self._dungeon.objects():
-            loot_x, loot_y = loot.position()
-            if loot_x != obj_x or loot_y != obj_y:
+                    self._sprites.draw(self._layer, *Tiles.SPRITE_TILE[cell], x, y, brightness=brightness)
+
+    def _render_map(self, surface: Surface, hero_x: int, hero_y: int) -> list:
+        start_x, start_y, width, height = self._viewport(hero_x, hero_y)
+        layer_key = (hero_x, hero_y, self._dungeon.fog_version())
+        full_redraw = self._layer is None or layer_key != self._layer_key
+        if full_redraw:
+            self._render_layer(start_x, start_y, width, height, hero_x, hero_y)
+            self._layer_key = layer_key
+
+        sprites = dict()
+        viewport = Rect(start_x, start_y, width, height)
+        self._render_map_objects(sprites, viewport)
+        self._render_map_monsters(sprites, viewport)
+        # render hero
+        sprites.setdefault((hero_x - start_x, hero_y - start_y), []).append((0, 4, 1.0))
+
+        tile_width, tile_height = self._sprites.tile_width(), self._sprites.tile_height()
+        if full_redraw:
+            surface.blit(self._layer, (0, 0))
+            for (x, y), cell_sprites in sprites.items():
+                for tile_row, tile_col, brightness in cell_sprites:
+                    self._sprites.draw(surface, tile_row, tile_col, x, y, brightness)
+            self._sprites_drawn = sprites
+            return [(0, 0, self._width, self._height)]
+
+        # entities moved over an unchanged layer, restore and redraw only their cells
+        dirty = list()
+        for cell in sprites.keys() | self._sprites_drawn.keys():
+            cell_sprites = sprites.get(cell)
+            if cell_sprites == self._sprites_drawn.get(cell):
                 continue
-            self._sprites.draw(surface, *Tiles.SPRITE_OBJECT[loot.type()], x, y, brightness=brightness)
+            x, y = cell
+            area = (x * tile_width, y * tile_height, tile_width, tile_height)
+            surface.blit(self._layer, area, area)
+            for tile_row, tile_col, brightness in cell_sprites or ():
+                self._sprites.draw(surface, tile_row, tile_col, x, y, brightness)
+            dirty.append(area)
+        self._sprites_drawn = sprites
+        return dirty
+
+    def _render_map_objects(self, sprites: dict, viewport: Rect) -> None:
+        start_x, start_y = viewport.position()
+        for loot_x, loot_y, loot_type in self._dungeon.object_types_in(viewport):
+            cell = (loot_x - start_x, loot_y - start_y)
+            if cell not in self._brightness:
+                continue
+            sprites.setdefault(cell, []).append((*Tiles.SPRITE_OBJECT[loot_type], self._brightness[cell]))
 
-    def _render_map_monsters(self, surface: Surface, obj_x: int, obj_y: int, x: int, y: int, brightness: float) -> None:
-        for monster in self._dungeon.monsters():
-            mon_x, mon_y = monster.position()
-            if mon_x != obj_x or mon_y != obj_y:
+    def _render_map_monsters(self, sprites: dict, viewport: Rect) -> None:
+        start_x, start_y = viewport.position()
+        for mon_x, mon_y, mon_type in self._dungeon.monster_types_in(viewport):
+            cell = (mon_x - start_x, mon_y - start_y)
+            if cell not in self._brightness:
                 continue
-            self._sprites.draw(surface, *Tiles.SPRITE_MONSTER[monster.type()], x, y, brightness=brightness)
-
-    def _calc_tile_brightness(self, real_x: int, real_y: int, hero_x: int, hero_y: int) -> float:
-        # Ray cast from hero to point
-        dx = real_x - hero_x
-        dy = real_y - hero_y
-        mx = max(abs(dx), abs(dy))
-        if mx == 0:
+            sprites.setdefault(cell, []).append((*Tiles.SPRITE_MONSTER[mon_type], self._brightness[cell]))
+
+    def _calc_distance_brightness(self, distance: int) -> float:
+        if distance == 0:
             return 1.0
-        brightness = self._calc_distance_brightness(Point.dst(hero_x, hero_y, real_x, real_y))
-        vec = (dx / mx, dy / mx)
-        x, y = float(hero_x), float(hero_y)
-        row, col = 0, 0
-        while col != real_x or row != real_y:
-            x += vec[0]
-            y += vec[1]
-            row = int(round(y))
-            col = int(round(x))
-            if self._dungeon.get(col, row) in Dungeon.STOP_TILES:
-                return brightness if col == real_x and row == real_y else 0.6
-
-        return brightness
-
-    def _calc_distance_brightness(self, distance: float) -> float:
         return 0.015 + 6.6 / distance  # todo: make constants as settings
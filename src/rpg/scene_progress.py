@@ -1,8 +1,6 @@
-import threading
-from typing import Callable
 from pygame import Surface, draw, font
 from rpg.scene import AbstractScene
-from rpg.dungeon import Dungeon
+from rpg.levels import LevelManager
 from rpg.scene_game import SceneGame
 
 
@@ -12,38 +10,26 @@ class SceneProgress(AbstractScene):
     PROGRESS_BAR_BACKGROUND_COLOR = (0, 0, 255)
     PROGRESS_BAR_FOREGROUND_COLOR = (255, 0, 0)
 
-    class BackgroundGeneration(threading.Thread):
-
-        def __init__(self, progress: Callable[[int], None], data_ready: Callable[[Dungeon], None]):
-            super().__init__()
-            self._progress = progress
-            self._ready = data_ready
-
-        def run(self) -> None:
-            self._ready(Dungeon(256, 256, self._progress))
-
-    def __init__(self, width: int, height: int):
+    def __init__(self, width: int, height: int, levels: LevelManager, depth: int = 0):
         super().__init__()
         self._width = width
         self._height = height
+        self._levels = levels
+        self._depth = depth
         self._progress = 0
-        self._finished = False
-        self._data = None
         self._font = font.Font('freesansbold.ttf', 10)
-        thread = SceneProgress.BackgroundGeneration(self._generation_progress, self._create_next_scene)
-        thread.start()
-
-    def _create_next_scene(self, map_data: Dungeon):
-        self._data = map_data
-        self._finished = True
-
-    def _generation_progress(self, progress: int):
-        self._progress = progress
+        levels.request(depth)
+        # a prefetched level is ready right away and the scene is skipped
+        self._data = levels.level(depth)
 
     def update(self) -> None:
-        return
+        # called from the UI thread, never blocks
+        self._progress = self._levels.progress(self._depth)
+        if self._data is None:
+            self._data = self._levels.level(self._depth)
 
     def render(self, surface: Surface) -> None:
+        surface.fill((0, 0, 0))
         left = self._width // 2 - SceneProgress.PROGRESS_BAR_WIDTH // 2
         top = self._height // 2 - SceneProgress.PROGRESS_BAR_HEIGHT // 2
 
@@ -67,7 +53,7 @@ class SceneProgress(AbstractScene):
         surface.blit(text, (left + 2, top + SceneProgress.PROGRESS_BAR_HEIGHT + 4))
 
     def is_finished(self) -> bool:
-        return self._finished
+        return self._data is not None
 
     def next_scene(self) -> AbstractScene:
-        return SceneGame(self._data, self._width, self._height)
+        return SceneGame(self._data, self._width, self._height, levels=self._levels, depth=self._depth)
@@ -0,0 +1,52 @@
+from __future__ import annotations
+from time import perf_counter, sleep
+from typing import Callable
+
+
+class FixedStepScheduler:
+    # simulation advances in fixed ticks, rendering runs once per frame at its own rate;
+    # a render rate of 0 never waits, frames are then paced by vsync when the display provides it
+
+    def __init__(self, tick_rate: int, render_rate: int = 0, max_frame_skip: int = 5,
+                 clock: Callable[[], float] = perf_counter, wait: Callable[[float], None] = sleep) -> None:
+        if tick_rate < 1:
+            raise ValueError("Tick rate cannot be lesser than 1")
+        self._tick = 1.0 / tick_rate
+        self._frame = 1.0 / render_rate if render_rate > 0 else 0.0
+        self._max_frame_skip = max_frame_skip
+        self._clock = clock
+        self._wait = wait
+        self._previous = clock()
+        self._frame_start = self._previous
+        self._lag = 0.0
+        self._skipped = 0
+
+    def ticks(self) -> int:
+        # number of simulation steps due before the next render
+        now = self._clock()
+        self._lag += now - self._previous
+        self._previous = now
+        self._frame_start = now
+        ticks = int(self._lag / self._tick)
+        if ticks > self._max_frame_skip:
+            # under load: run at most max_frame_skip updates and drop the rest instead of spiralling
+            self._skipped += ticks - self._max_frame_skip
+            ticks = self._max_frame_skip
+            self._lag = 0.0
+        else:
+            self._lag -= ticks * self._tick
+        return ticks
+
+    def wait_frame(self) -> None:
+        if self._frame <= 0.0:
+            return
+        remaining = self._frame - (self._clock() - self._frame_start)
+        if remaining > 0.0:
+            self._wait(remaining)
+
+    def alpha(self) -> float:
+        # fraction of the next tick already elapsed, for interpolating between simulation states
+        return self._lag / self._tick
+
+    def skipped(self) -> int:
+        return self._skipped
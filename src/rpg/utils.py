@@ -1,36 +1,32 @@
 from __future__ import annotations
+from array import array
 from math import isqrt
-from typing import Any
+from operator import itemgetter
+from typing import Any, Iterator, Union
 
 
-class Point:
+class Point(tuple):
+    # immutable (x, y) pair; equality and hashing are the ones of tuple, so points are as cheap as plain
+    # tuples and both can be used for the same dict keys
+    __slots__ = ()
+    # packed keys hold both coordinates in one int, signed values are stored with an offset
+    PACK_BITS = 32
+    PACK_OFFSET = 1 << 31
+    PACK_MASK = (1 << 32) - 1
 
-    def __init__(self, x: int = 0, y: int = 0, another: Point = None):
+    def __new__(cls, x: int = 0, y: int = 0, another: Point = None) -> Point:
         if another is not None:
-            self._x = another.x
-            self._y = another.y
-        else:
-            self._x = x
-            self._y = y
-
-    def tup(self) -> tuple:
-        return self.x, self.y
+            return tuple.__new__(cls, (another.x, another.y))
+        return tuple.__new__(cls, (x, y))
 
-    @property
-    def x(self) -> int:
-        return self._x
+    x = property(itemgetter(0))
+    y = property(itemgetter(1))
 
-    @x.setter
-    def x(self, x: int) -> None:
-        self._x = x
-
-    @property
-    def y(self) -> int:
-        return self._y
+    def tup(self) -> tuple:
+        return self[0], self[1]
 
-    @y.setter
-    def y(self, y: int) -> None:
-        self._y = y
+    def moved(self, dx: int = 0, dy: int = 0) -> Point:
+        return tuple.__new__(Point, (self[0] + dx, self[1] + dy))
 
     @staticmethod
     def dst(x1: int, y1: int, x2: int, y2: int):
@@ -38,24 +34,30 @@ class Point:
 
     def distance(self, x: int = 0, y: int = 0, another: Point = None) -> int:
         if another is not None:
-            return Point.dst(self._x, self._y, another.x, another.y)
-        return Point.dst(self._x, self._y, x, y)
+            return Point.dst(self[0], self[1], another.x, another.y)
+        return Point.dst(self[0], self[1], x, y)
 
-    def __eq__(self, other: Any) -> bool:
-        if type(other) != Point:
-            return False
-        return other.x == self.x and other.y == self.y
+    @staticmethod
+    def pack(x: int, y: int) -> int:
+        return (y + Point.PACK_OFFSET) << Point.PACK_BITS | (x + Point.PACK_OFFSET)
 
-    def __ne__(self, other: Any) -> bool:
-        if type(other) != Point:
-            return True
-        return other.x != self.x or other.y != self.y
+    @staticmethod
+    def unpack(key: int) -> Point:
+        return tuple.__new__(Point, (
+            (key & Point.PACK_MASK) - Point.PACK_OFFSET, (key >> Point.PACK_BITS) - Point.PACK_OFFSET))
 
-    def __hash__(self) -> int:
-        return self._x * 1_000_000 + self._y
+    def key(self) -> int:
+        return (self[1] + Point.PACK_OFFSET) << Point.PACK_BITS | (self[0] + Point.PACK_OFFSET)
+
+    def __repr__(self) -> str:
+        return "Point({}, {})".format(self[0], self[1])
+
+    def __getnewargs__(self) -> tuple:
+        return self[0], self[1]
 
 
 class Bounded:
+    __slots__ = ()
 
     def bounds(self) -> tuple:
         pass
@@ -65,6 +67,7 @@ class Bounded:
 
 
 class Rect(Bounded):
+    __slots__ = ("_x", "_y", "_width", "_height")
 
     def __init__(self, x: int, y: int, width: int, height: int):
         if width < 1 or height < 1:
@@ -94,16 +97,43 @@ class Rect(Bounded):
     def position(self) -> tuple:
         return self._x, self._y
 
+    def __eq__(self, other: Any) -> bool:
+        return other.__class__ is self.__class__ and self._x == other._x and self._y == other._y and \
+            self._width == other._width and self._height == other._height
+
+    def __hash__(self) -> int:
+        return hash((self._x, self._y, self._width, self._height))
+
+
+class GridWatcher:
+
+    def changed(self, left: int, top: int, right: int, bottom: int) -> None:
+        pass
+
 
 class Grid(Bounded):
+    TYPECODE = 'b'
 
-    def __init__(self, width: int, height: int, init_value: int = 0, data: list = None) -> None:
+    def __init__(self, width: int, height: int, init_value: int = 0, data: Union[array, memoryview] = None) -> None:
         self._width = width
         self._height = height
         if data is None:
-            self._data = [[init_value for _ in range(self._width)] for _ in range(self._height)]
+            self._data = array(Grid.TYPECODE, [init_value]) * (width * height)
         else:
+            if len(data) != width * height:
+                raise ValueError("Data length {} does not match grid size {}x{}".format(len(data), width, height))
             self._data = data
+        self._watchers = list()
+
+    def watch(self, watcher: GridWatcher) -> None:
+        self._watchers.append(watcher)
+
+    def unwatch(self, watcher: GridWatcher) -> None:
+        self._watchers.remove(watcher)
+
+    def _changed(self, left: int, top: int, right: int, bottom: int) -> None:
+        for watcher in self._watchers:
+            watcher.changed(left, top, right, bottom)
 
     def bounds(self) -> tuple:
         return 0, 0, self._width, self._height
@@ -111,44 +141,148 @@ class Grid(Bounded):
     def in_bounds(self, x: int, y: int) -> bool:
         return 0 <= x < self._width and 0 <= y < self._height
 
+    def index(self, x: int, y: int) -> int:
+        return y * self._width + x
+
     def put(self, x: int, y: int, val: int) -> None:
-        if not self.in_bounds(x, y):
+        if not (0 <= x < self._width and 0 <= y < self._height):
             raise ValueError("Coordinates ({},{}) are out of bounds".format(x, y))
-        self._data[y][x] = val
+        i = y * self._width + x
+        if self._watchers and self._data[i] != val:
+            self._data[i] = val
+            self._changed(x, y, x + 1, y + 1)
+        else:
+            self._data[i] = val
+
+    def put_indices(self, indices: list, val: int) -> None:
+        # scatter write of flat indices; watchers get one rectangle per 8x8 block holding written cells
+        if not indices:
+            return
+        data = self._data
+        for i in indices:
+            data[i] = val
+        if self._watchers:
+            width = self._width
+            blocks = dict()
+            for i in indices:
+                x, y = i % width, i // width
+                key = (x >> 3, y >> 3)
+                box = blocks.get(key)
+                if box is None:
+                    blocks[key] = [x, y, x + 1, y + 1]
+                else:
+                    box[0], box[1] = min(box[0], x), min(box[1], y)
+                    box[2], box[3] = max(box[2], x + 1), max(box[3], y + 1)
+            for left, top, right, bottom in blocks.values():
+                self._changed(left, top, right, bottom)
 
     def get(self, x: int, y: int) -> int:
-        if not self.in_bounds(x, y):
+        if not (0 <= x < self._width and 0 <= y < self._height):
             raise ValueError("Coordinates ({},{}) are out of bounds".format(x, y))
-        return self._data[y][x]
+        return self._data[y * self._width + x]
 
     def neighbours(self, x: int, y: int, allowed: set, diagonals: bool = False) -> list:
-        if not self.in_bounds(x, y):
+        if not (0 <= x < self._width and 0 <= y < self._height):
             raise ValueError("Coordinates ({},{}) are out of bounds".format(x, y))
+        data = self._data
+        width = self._width
+        i = y * width + x
+        has_top = y > 0
+        has_right = x + 1 < width
+        has_bottom = y + 1 < self._height
+        has_left = x > 0
         result = []
-        if y - 1 > -1 and self._data[y - 1][x] in allowed:
+        if has_top and data[i - width] in allowed:
             result.append((x, y - 1))
-        if x + 1 < self._width and self._data[y][x + 1] in allowed:
+        if has_right and data[i + 1] in allowed:
             result.append((x + 1, y))
-        if y + 1 < self._height and self._data[y + 1][x] in allowed:
+        if has_bottom and data[i + width] in allowed:
             result.append((x, y + 1))
-        if x - 1 > -1 and self._data[y][x - 1] in allowed:
+        if has_left and data[i - 1] in allowed:
             result.append((x - 1, y))
         if diagonals:
-            if y - 1 > -1 and x - 1 > -1 and self._data[y - 1][x - 1] in allowed:
+            if has_top and has_left and data[i - width - 1] in allowed:
                 result.append((x - 1, y - 1))
-            if y - 1 > -1 and x + 1 < self._width and self._data[y - 1][x + 1] in allowed:
+            if has_top and has_right and data[i - width + 1] in allowed:
                 result.append((x + 1, y - 1))
-            if y + 1 < self._height and x + 1 < self._width and self._data[y + 1][x + 1] in allowed:
+            if has_bottom and has_right and data[i + width + 1] in allowed:
                 result.append((x + 1, y + 1))
-            if y + 1 < self._height and x - 1 > -1 and self._data[y + 1][x - 1] in allowed:
+            if has_bottom and has_left and data[i + width - 1] in allowed:
                 result.append((x - 1, y + 1))
         return result
 
+    def _clip(self, left: int, top: int, right: int, bottom: int) -> tuple:
+        return max(left, 0), max(top, 0), min(right, self._width), min(bottom, self._height)
+
     def copy(self, left: int, top: int, right: int, bottom: int) -> Grid:
-        left, top = max(left, 0), max(top, 0)
-        right, bottom = min(right, self._width), min(bottom, self._height)
-        width, height = right - left, bottom - top
-        return Grid(width, height, data=[[self._data[y][x] for x in range(left, right)] for y in range(top, bottom)])
+        left, top, right, bottom = self._clip(left, top, right, bottom)
+        width, height = max(right - left, 0), max(bottom - top, 0)
+        data = array(Grid.TYPECODE)
+        if left == 0 and width == self._width:
+            data.frombytes(self._data[top * self._width:bottom * self._width])
+            return Grid(width, height, data=data)
+        for y in range(top, bottom):
+            data.extend(self.row(y, left, right))
+        return Grid(width, height, data=data)
+
+    def row(self, y: int, left: int = 0, right: int = None) -> array:
+        if not 0 <= y < self._height:
+            raise ValueError("Row {} is out of bounds".format(y))
+        if right is None:
+            right = self._width
+        left, right = max(left, 0), min(right, self._width)
+        offset = y * self._width
+        if isinstance(self._data, array):
+            return self._data[offset + left:offset + right]
+        row = array(Grid.TYPECODE)
+        row.frombytes(self._data[offset + left:offset + right])
+        return row
+
+    def fill(self, val: int, left: int = 0, top: int = 0, right: int = None, bottom: int = None) -> None:
+        if right is None:
+            right = self._width
+        if bottom is None:
+            bottom = self._height
+        left, top, right, bottom = self._clip(left, top, right, bottom)
+        if right <= left or bottom <= top:
+            return
+        span = array(Grid.TYPECODE, [val]) * (right - left)
+        for y in range(top, bottom):
+            offset = y * self._width
+            self._data[offset + left:offset + right] = span
+        self._changed(left, top, right, bottom)
+
+    @staticmethod
+    def lookup_table(values: dict, default: Any = 0) -> list:
+        # indexed by raw cell values; signed tile values index the table from its end, the same way a signed byte wraps
+        table = [default] * 256
+        for tile, value in values.items():
+            table[tile] = value
+        return table
+
+    def mask(self, allowed: set) -> bytearray:
+        table = bytes(Grid.lookup_table(dict.fromkeys(allowed, 1)))
+        return bytearray(self._data.tobytes().translate(table))
+
+    def cell_mask(self, allowed: set) -> CellMask:
+        return CellMask(self._width, self._height, self.mask(allowed))
+
+    def put_mask(self, mask: bytearray, val: int) -> None:
+        if len(mask) != len(self._data):
+            raise ValueError("Mask length {} does not match grid size {}x{}".format(
+                len(mask), self._width, self._height))
+        data = self._data
+        index = mask.find(1)
+        while index != -1:
+            data[index] = val
+            index = mask.find(1, index + 1)
+        self._changed(0, 0, self._width, self._height)
+
+    def count(self, val: int) -> int:
+        return self._data.tobytes().count(val & 0xFF)
+
+    def raw(self) -> Union[array, memoryview]:
+        return self._data
 
     def width(self):
         return self._width
@@ -157,8 +291,322 @@ class Grid(Bounded):
         return self._height
 
     def __iter__(self):
-        self._iter = iter(self._data)
+        width = self._width
+        for offset in range(0, width * self._height, width):
+            yield self._data[offset:offset + width]
+
+
+class BitGrid(Bounded):
+    # one bit per cell, rows are byte aligned and the lowest bit of a row is its leftmost cell
+    _stencils = dict()
+
+    def __init__(self, width: int, height: int, data: Union[bytearray, memoryview] = None) -> None:
+        self._width = width
+        self._height = height
+        self._stride = (width + 7) // 8
+        if data is None:
+            self._data = bytearray(self._stride * height)
+        else:
+            if len(data) != self._stride * height:
+                raise ValueError("Data length {} does not match bit grid size {}x{}".format(len(data), width, height))
+            self._data = data
+
+    def bounds(self) -> tuple:
+        return 0, 0, self._width, self._height
+
+    def in_bounds(self, x: int, y: int) -> bool:
+        return 0 <= x < self._width and 0 <= y < self._height
+
+    def get(self, x: int, y: int) -> int:
+        if not (0 <= x < self._width and 0 <= y < self._height):
+            raise ValueError("Coordinates ({},{}) are out of bounds".format(x, y))
+        return (self._data[y * self._stride + (x >> 3)] >> (x & 7)) & 1
+
+    def put(self, x: int, y: int, val: int) -> None:
+        if not (0 <= x < self._width and 0 <= y < self._height):
+            raise ValueError("Coordinates ({},{}) are out of bounds".format(x, y))
+        i = y * self._stride + (x >> 3)
+        if val:
+            self._data[i] |= 1 << (x & 7)
+        else:
+            self._data[i] &= ~(1 << (x & 7)) & 0xFF
+
+    def row(self, y: int) -> int:
+        offset = y * self._stride
+        return int.from_bytes(self._data[offset:offset + self._stride], "little")
+
+    def or_row(self, y: int, x: int, bits: int) -> bool:
+        # sets the given bits starting at column x, returns True if any of them was not set yet
+        if not 0 <= y < self._height:
+            return False
+        if x < 0:
+            bits >>= -x
+            x = 0
+        if x >= self._width:
+            return False
+        bits &= (1 << (self._width - x)) - 1
+        if not bits:
+            return False
+        # only the bytes the bits fall into are read and written back
+        bits <<= x & 7
+        start = y * self._stride + (x >> 3)
+        end = start + (bits.bit_length() + 7) // 8
+        old = int.from_bytes(self._data[start:end], "little")
+        new = old | bits
+        if new == old:
+            return False
+        self._data[start:end] = new.to_bytes(end - start, "little")
+        return True
+
+    def stamp(self, center_x: int, center_y: int, stencil: tuple) -> bool:
+        changed = False
+        for dy, dx, bits in stencil:
+            if self.or_row(center_y + dy, center_x + dx, bits):
+                changed = True
+        return changed
+
+    @staticmethod
+    def disk(radius: int) -> tuple:
+        # rows of (dy, dx of the leftmost bit, bits) covering cells with isqrt(distance) <= radius
+        stencil = BitGrid._stencils.get(radius)
+        if stencil is None:
+            rows = list()
+            for dy in range(-radius, radius + 1):
+                half = 0
+                while isqrt((half + 1) ** 2 + dy ** 2) <= radius:
+                    half += 1
+                rows.append((dy, -half, (1 << (2 * half + 1)) - 1))
+            stencil = BitGrid._stencils[radius] = tuple(rows)
+        return stencil
+
+    def count(self) -> int:
+        return sum(bin(byte).count("1") for byte in self._data)
+
+    def raw(self) -> Union[bytearray, memoryview]:
+        return self._data
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+
+class CellMask(Bounded):
+    # one byte per cell packed into a single int, the lowest byte is the top left cell; boolean and
+    # neighbourhood operations over the whole grid are a few big int shifts instead of a loop over cells
+    _patterns = dict()
+
+    def __init__(self, width: int, height: int, cells: Union[bytes, bytearray, int] = 0) -> None:
+        self._width = width
+        self._height = height
+        if isinstance(cells, int):
+            self._cells = cells
+        else:
+            if len(cells) != width * height:
+                raise ValueError("Mask length {} does not match grid size {}x{}".format(len(cells), width, height))
+            self._cells = int.from_bytes(cells, "little")
+
+    def _pattern(self) -> tuple:
+        # (all cells, all but the first column, all but the last column, all but the border)
+        key = (self._width, self._height)
+        pattern = CellMask._patterns.get(key)
+        if pattern is None:
+            width, height = key
+            row = b"\1" * width
+            inner_row = b"\0" + b"\1" * (width - 2) + b"\0" if width > 1 else b"\0"
+            pattern = (
+                int.from_bytes(row * height, "little"),
+                int.from_bytes((b"\0" + row[1:]) * height, "little"),
+                int.from_bytes((row[1:] + b"\0") * height, "little"),
+                int.from_bytes(bytes(width) + inner_row * (height - 2) + bytes(width), "little") if height > 1 else 0,
+            )
+            CellMask._patterns[key] = pattern
+        return pattern
+
+    def _new(self, cells: int) -> CellMask:
+        return CellMask(self._width, self._height, cells)
+
+    def bounds(self) -> tuple:
+        return 0, 0, self._width, self._height
+
+    def in_bounds(self, x: int, y: int) -> bool:
+        return 0 <= x < self._width and 0 <= y < self._height
+
+    def shift(self, dx: int, dy: int) -> CellMask:
+        # moves every cell by (dx, dy), cells moved out of the grid are dropped
+        everything, not_first, not_last, _ = self._pattern()
+        cells = self._cells
+        for _ in range(abs(dx)):
+            cells = (cells << 8) & not_first if dx > 0 else (cells >> 8) & not_last
+        row = 8 * self._width
+        for _ in range(abs(dy)):
+            cells = (cells << row) & everything if dy > 0 else cells >> row
+        return self._new(cells)
+
+    def dilate(self, diagonals: bool = True) -> CellMask:
+        # cells that are set or touch a set cell
+        horizontal = self | self.shift(1, 0) | self.shift(-1, 0)
+        vertical = horizontal if diagonals else self
+        return horizontal | vertical.shift(0, 1) | vertical.shift(0, -1)
+
+    def erode(self, diagonals: bool = True) -> CellMask:
+        # cells whose whole neighbourhood is set, the outside of the grid counts as set
+        return ~(~self).dilate(diagonals)
+
+    def at_least(self, count: int, diagonals: bool = True) -> CellMask:
+        # cells with at least count set neighbours; counts stay below 9, so each byte adds up without carry
+        everything = self._pattern()[0]
+        if count <= 0:
+            return self._new(everything)
+        offsets = ((-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)) if diagonals else \
+            ((0, -1), (-1, 0), (1, 0), (0, 1))
+        counts = sum(self.shift(dx, dy)._cells for dx, dy in offsets)
+        # the high bit of a byte is set when its count reaches the threshold
+        return self._new(((counts + everything * (128 - count)) >> 7) & everything)
+
+    def interior(self) -> CellMask:
+        return self._new(self._cells & self._pattern()[3])
+
+    def get(self, x: int, y: int) -> int:
+        if not (0 <= x < self._width and 0 <= y < self._height):
+            raise ValueError("Coordinates ({},{}) are out of bounds".format(x, y))
+        return (self._cells >> (8 * (y * self._width + x))) & 1
+
+    def count(self) -> int:
+        return self.to_bytes().count(1)
+
+    def to_bytes(self) -> bytearray:
+        return bytearray(self._cells.to_bytes(self._width * self._height, "little"))
+
+    def width(self) -> int:
+        return self._width
+
+    def height(self) -> int:
+        return self._height
+
+    def __or__(self, other: CellMask) -> CellMask:
+        return self._new(self._cells | other._cells)
+
+    def __and__(self, other: CellMask) -> CellMask:
+        return self._new(self._cells & other._cells)
+
+    def __sub__(self, other: CellMask) -> CellMask:
+        return self._new(self._cells & ~other._cells)
+
+    def __invert__(self) -> CellMask:
+        return self._new(self._cells ^ self._pattern()[0])
+
+
+class CostField(GridWatcher):
+
+    def __init__(self, grid: Grid, weights: dict) -> None:
+        self._grid = grid
+        self._table = Grid.lookup_table(weights)
+        self._field = array('l', [0]) * (grid.width() * grid.height())
+        self.changed(0, 0, grid.width(), grid.height())
+
+    def attach(self) -> CostField:
+        self._grid.watch(self)
         return self
 
-    def __next__(self):
-        return next(self._iter)
+    def detach(self) -> None:
+        self._grid.unwatch(self)
+
+    def changed(self, left: int, top: int, right: int, bottom: int) -> None:
+        # a changed cell alters the weight of its 3x3 neighbourhood
+        width, height = self._grid.width(), self._grid.height()
+        left, top = max(left - 1, 0), max(top - 1, 0)
+        right, bottom = min(right + 1, width), min(bottom + 1, height)
+        if right <= left or bottom <= top:
+            return
+        table = self._table
+        data = self._grid.raw()
+        # per-row weights padded by one column on each side, then summed horizontally
+        row_left, row_right = max(left - 1, 0), min(right + 1, width)
+        pad_left = [0] if row_left == left else []
+        pad_right = [0] if row_right == right else []
+        sums = dict()
+        centers = dict()
+        for y in range(max(top - 1, 0), min(bottom + 1, height)):
+            offset = y * width
+            weights = pad_left + [table[v] for v in data[offset + row_left:offset + row_right]] + pad_right
+            sums[y] = [weights[i] + weights[i + 1] + weights[i + 2] for i in range(right - left)]
+            centers[y] = weights[1:-1]
+        empty = [0] * (right - left)
+        field = self._field
+        for y in range(top, bottom):
+            above, below = sums.get(y - 1, empty), sums.get(y + 1, empty)
+            current, center = sums[y], centers[y]
+            offset = y * width
+            field[offset + left:offset + right] = array('l', [
+                above[i] + current[i] + below[i] - center[i] for i in range(right - left)
+            ])
+
+    def raw(self) -> array:
+        return self._field
+
+    def get(self, x: int, y: int) -> int:
+        return self._field[y * self._grid.width() + x]
+
+    def __call__(self, point: tuple) -> int:
+        return self.get(*point)
+
+
+class SpatialIndex:
+    # objects are bucketed by cell, cells are grouped into square chunks for rectangle queries
+    DEFAULT_CHUNK_SIZE = 16
+
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+        self._chunk_size = chunk_size
+        self._chunks = dict()
+        self._size = 0
+
+    def _chunk(self, x: int, y: int) -> tuple:
+        return x // self._chunk_size, y // self._chunk_size
+
+    def add(self, obj: Any, x: int, y: int) -> None:
+        cells = self._chunks.setdefault(self._chunk(x, y), dict())
+        cells.setdefault((x, y), list()).append(obj)
+        self._size += 1
+
+    def remove(self, obj: Any, x: int, y: int) -> None:
+        chunk = self._chunk(x, y)
+        cells = self._chunks.get(chunk)
+        if cells is None or (x, y) not in cells or obj not in cells[(x, y)]:
+            raise ValueError("Object is not indexed at ({},{})".format(x, y))
+        bucket = cells[(x, y)]
+        bucket.remove(obj)
+        if not bucket:
+            del cells[(x, y)]
+            if not cells:
+                del self._chunks[chunk]
+        self._size -= 1
+
+    def move(self, obj: Any, old_x: int, old_y: int, new_x: int, new_y: int) -> None:
+        self.remove(obj, old_x, old_y)
+        self.add(obj, new_x, new_y)
+
+    def at(self, x: int, y: int) -> list:
+        cells = self._chunks.get(self._chunk(x, y))
+        if cells is None:
+            return []
+        return cells.get((x, y), [])
+
+    def query(self, area: Bounded) -> Iterator[tuple]:
+        # yields (x, y, obj) for every object inside the area
+        left, top, right, bottom = area.bounds()
+        chunk_left, chunk_top = self._chunk(left, top)
+        chunk_right, chunk_bottom = self._chunk(right - 1, bottom - 1)
+        for chunk_y in range(chunk_top, chunk_bottom + 1):
+            for chunk_x in range(chunk_left, chunk_right + 1):
+                cells = self._chunks.get((chunk_x, chunk_y))
+                if cells is None:
+                    continue
+                for (x, y), bucket in cells.items():
+                    if left <= x < right and top <= y < bottom:
+                        for obj in bucket:
+                            yield x, y, obj
+
+    def __len__(self) -> int:
+        return self._size
@@ -0,0 +1,299 @@
+from __future__ import annotations
+import os
+import random
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import Iterator, Optional
+from rpg.dungeon import Dungeon
+from rpg.dungeon_file import DungeonFile
+from rpg.utils import Point, Grid, Rect
+
+
+def generate_chunk_packed(chunk_size: int, seed: int, portals: list) -> tuple:
+    # worker entry point, see rpg.dungeon.generate_packed
+    return Dungeon(chunk_size, chunk_size, seed=seed, portals=portals, reveal_start=False).pack()
+
+
+class ChunkedDungeon:
+    # a world made of square Dungeon chunks generated on demand; every chunk is derived from the world seed
+    # and its coordinates only, so evicted chunks that were never paged out can be regenerated identically
+    CHUNK_SIZE = 128
+    MAX_LOADED_CHUNKS = 16
+    # chunks within this distance from the hero are generated before they come into view
+    PREFETCH_DISTANCE = 48
+
+    def __init__(self, width: int, height: int, seed: int = None, directory: str = None,
+                 chunk_size: int = CHUNK_SIZE, max_loaded_chunks: int = MAX_LOADED_CHUNKS,
+                 executor: Executor = None) -> None:
+        if seed is None:
+            seed = random.randrange(1 << 32)
+        self._seed = seed
+        self._chunk_size = chunk_size
+        self._chunks_x = -(-width // chunk_size)
+        self._chunks_y = -(-height // chunk_size)
+        self._width = self._chunks_x * chunk_size
+        self._height = self._chunks_y * chunk_size
+        # pages of a temporary directory only live as long as the world, see close
+        self._temporary = tempfile.TemporaryDirectory(prefix="roguelike-world-") if directory is None else None
+        self._directory = directory if directory is not None else self._temporary.name
+        os.makedirs(self._directory, exist_ok=True)
+        self._max_loaded_chunks = max_loaded_chunks
+        # without an executor chunks are generated synchronously on first access
+        self._executor = executor
+        self._pending = dict()
+        self._loaded = OrderedDict()
+        self._fog_version = 0
+        # even the first chunk is generated by the executor: the world itself is built in a thread,
+        # which would hold the GIL for the whole generation and stall the progress scene
+        self._generate(0, 0)
+        self._hero_position = Point(*self._chunk(0, 0).hero_position().tup())
+        # the neighbours are requested by the first render, not here: levels built ahead of time
+        # must not queue their chunks in front of the ones the hero is walking into
+        self._reveal()
+
+    def _random(self, *key) -> random.Random:
+        # string seeds are hashed with sha512, so the stream does not depend on PYTHONHASHSEED
+        return random.Random(":".join(str(part) for part in (self._seed,) + key))
+
+    def _edge_offset(self, kind: str, chunk_x: int, chunk_y: int) -> int:
+        # position of the corridor crossing the right ('v') or bottom ('h') edge of a chunk
+        return self._random(kind, chunk_x, chunk_y).randrange(2, self._chunk_size - 2)
+
+    def _portals(self, chunk_x: int, chunk_y: int) -> list:
+        last = self._chunk_size - 1
+        portals = list()
+        if chunk_x > 0:
+            portals.append((0, self._edge_offset("v", chunk_x - 1, chunk_y)))
+        if chunk_x < self._chunks_x - 1:
+            portals.append((last, self._edge_offset("v", chunk_x, chunk_y)))
+        if chunk_y > 0:
+            portals.append((self._edge_offset("h", chunk_x, chunk_y - 1), 0))
+        if chunk_y < self._chunks_y - 1:
+            portals.append((self._edge_offset("h", chunk_x, chunk_y), last))
+        return portals
+
+    def _chunk_seed(self, chunk_x: int, chunk_y: int) -> int:
+        return self._random("chunk", chunk_x, chunk_y).randrange(1 << 32)
+
+    def _page_path(self, chunk_x: int, chunk_y: int) -> str:
+        return os.path.join(self._directory, "chunk_{}_{}.dungeon".format(chunk_x, chunk_y))
+
+    def _install(self, key: tuple, chunk: Dungeon) -> None:
+        self._loaded[key] = chunk
+        while len(self._loaded) > self._max_loaded_chunks:
+            (evicted_x, evicted_y), evicted = self._loaded.popitem(last=False)
+            DungeonFile.save(evicted, self._page_path(evicted_x, evicted_y))
+
+    def _generate(self, chunk_x: int, chunk_y: int) -> None:
+        if self._executor is None:
+            return
+        key = (chunk_x, chunk_y)
+        if key in self._loaded or key in self._pending or os.path.exists(self._page_path(chunk_x, chunk_y)):
+            return
+        self._pending[key] = self._executor.submit(
+            generate_chunk_packed,
+            self._chunk_size,
+            self._chunk_seed(chunk_x, chunk_y),
+            self._portals(chunk_x, chunk_y)
+        )
+
+    def _collect(self) -> None:
+        # installs the chunks finished in the background, the hero may already stand close enough to see into them
+        finished = [key for key, future in self._pending.items() if future.done()]
+        for key in finished:
+            self._install(key, Dungeon.unpack(self._pending.pop(key).result()))
+        if finished:
+            self._fog_version += 1
+            self._reveal()
+
+    def _ready_chunk(self, chunk_x: int, chunk_y: int) -> Optional[Dungeon]:
+        # never waits for a chunk being generated, it is requested instead and None is returned
+        key = (chunk_x, chunk_y)
+        if self._executor is not None and key not in self._loaded:
+            self._generate(chunk_x, chunk_y)
+            future = self._pending.get(key)
+            if future is not None and not future.done():
+                return None
+        return self._chunk(chunk_x, chunk_y)
+
+    def _chunk(self, chunk_x: int, chunk_y: int) -> Dungeon:
+        key = (chunk_x, chunk_y)
+        chunk = self._loaded.get(key)
+        if chunk is not None:
+            self._loaded.move_to_end(key)
+            return chunk
+        path = self._page_path(chunk_x, chunk_y)
+        future = self._pending.pop(key, None)
+        if future is not None:
+            # the hero reached a chunk that is still being generated, nothing to do but wait for it
+            chunk = Dungeon.unpack(future.result())
+            self._fog_version += 1
+        elif os.path.exists(path):
+            chunk = DungeonFile.load(path)
+        else:
+            chunk = Dungeon(
+                self._chunk_size,
+                self._chunk_size,
+                seed=self._chunk_seed(chunk_x, chunk_y),
+                portals=self._portals(chunk_x, chunk_y),
+                reveal_start=False
+            )
+        self._install(key, chunk)
+        return chunk
+
+    def _chunks_in(self, left: int, top: int, right: int, bottom: int, wait: bool = True) -> Iterator[tuple]:
+        # yields (chunk, chunk left, chunk top) for every chunk overlapping the area,
+        # unless wait is set the chunks still being generated are skipped
+        size = self._chunk_size
+        left, top = max(left, 0), max(top, 0)
+        right, bottom = min(right, self._width), min(bottom, self._height)
+        if right <= left or bottom <= top:
+            return
+        for chunk_y in range(top // size, (bottom - 1) // size + 1):
+            for chunk_x in range(left // size, (right - 1) // size + 1):
+                chunk = self._chunk(chunk_x, chunk_y) if wait else self._ready_chunk(chunk_x, chunk_y)
+                if chunk is not None:
+                    yield chunk, chunk_x * size, chunk_y * size
+
+    def _prefetch(self, x: int, y: int) -> None:
+        self._collect()
+        distance = ChunkedDungeon.PREFETCH_DISTANCE
+        size = self._chunk_size
+        left, top = max(x - distance, 0), max(y - distance, 0)
+        right, bottom = min(x + distance + 1, self._width), min(y + distance + 1, self._height)
+        for chunk_y in range(top // size, (bottom - 1) // size + 1):
+            for chunk_x in range(left // size, (right - 1) // size + 1):
+                self._generate(chunk_x, chunk_y)
+
+    def flush(self) -> None:
+        for (chunk_x, chunk_y), chunk in self._loaded.items():
+            DungeonFile.save(chunk, self._page_path(chunk_x, chunk_y))
+
+    def close(self) -> None:
+        # queued chunks are dropped, a running one finishes in the background and its result is ignored
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        self._loaded.clear()
+        if self._temporary is not None:
+            self._temporary.cleanup()
+
+    def seed(self) -> int:
+        return self._seed
+
+    def loaded_chunks(self) -> list:
+        return list(self._loaded.keys())
+
+    def area(self, area: Rect) -> Grid:
+        left, top, right, bottom = area.bounds()
+        left, top = max(left, 0), max(top, 0)
+        right, bottom = min(right, self._width), min(bottom, self._height)
+        width, height = max(right - left, 0), max(bottom - top, 0)
+        result = Grid(width, height)
+        data = result.raw()
+        for chunk, chunk_left, chunk_top in self._chunks_in(left, top, right, bottom, wait=False):
+            tiles = chunk.tiles()
+            from_x, to_x = max(left, chunk_left), min(right, chunk_left + self._chunk_size)
+            for y in range(max(top, chunk_top), min(bottom, chunk_top + self._chunk_size)):
+                offset = (y - top) * width
+                data[offset + from_x - left:offset + to_x - left] = tiles.row(
+                    y - chunk_top, from_x - chunk_left, to_x - chunk_left)
+        return result
+
+    def hero_position(self) -> Point:
+        return self._hero_position
+
+    def move_hero(self, dx: int, dy: int) -> None:
+        self._hero_position = self._hero_position.moved(dx, dy)
+
+    def width(self) -> int:
+        return self._width
+
+    def height(self) -> int:
+        return self._height
+
+    def in_bounds(self, x: int, y: int) -> bool:
+        return 0 <= x < self._width and 0 <= y < self._height
+
+    def get(self, x: int, y: int) -> int:
+        if not self.in_bounds(x, y):
+            raise ValueError("Coordinates ({},{}) are out of bounds".format(x, y))
+        size = self._chunk_size
+        return self._chunk(x // size, y // size).get(x % size, y % size)
+
+    def is_movement_possible(self, x: int, y: int, dx: int, dy: int) -> bool:
+        if dx == 0 and dy == 0:  # None movement is impossible
+            return False
+        new_x = x + dx
+        new_y = y + dy
+        if not self.in_bounds(new_x, new_y):
+            return False
+        return self.get(new_x, new_y) in Dungeon.MOVEMENT_ALLOWED
+
+    def is_visited(self, x: int, y: int) -> bool:
+        size = self._chunk_size
+        chunk = self._ready_chunk(x // size, y // size)
+        return chunk is not None and chunk.is_visited(x % size, y % size)
+
+    def _reveal(self) -> None:
+        # only the hero's chunk is waited for, the fog of the others is lifted once they are installed
+        hero_x, hero_y = self._hero_position.tup()
+        self._chunk(hero_x // self._chunk_size, hero_y // self._chunk_size)
+        distance = Dungeon.VISIBLE_DISTANCE
+        for chunk, chunk_left, chunk_top in self._chunks_in(
+                hero_x - distance, hero_y - distance, hero_x + distance + 1, hero_y + distance + 1, wait=False):
+            if chunk.reveal(hero_x - chunk_left, hero_y - chunk_top):
+                self._fog_version += 1
+
+    def update_visible(self) -> None:
+        self._prefetch(*self._hero_position.tup())
+        self._reveal()
+
+    def fog_version(self) -> int:
+        return self._fog_version
+
+    def move_monsters(self) -> None:
+        # monsters stay in their chunk, only the ones sharing the chunk with the hero chase them;
+        # called once per tick, which is also when chunks finished in the background are picked up
+        self._collect()
+        size = self._chunk_size
+        hero_x, hero_y = self._hero_position.tup()
+        self._chunk(hero_x // size, hero_y // size).chase(hero_x % size, hero_y % size)
+
+    def objects_in(self, area: Rect) -> Iterator[tuple]:
+        left, top, right, bottom = area.bounds()
+        for chunk, chunk_left, chunk_top in self._chunks_in(left, top, right, bottom, wait=False):
+            local = Rect(left - chunk_left, top - chunk_top, right - left, bottom - top)
+            for x, y, loot in chunk.objects_in(local):
+                yield x + chunk_left, y + chunk_top, loot
+
+    def monsters_in(self, area: Rect) -> Iterator[tuple]:
+        # monsters live in the chunk they were generated in and are positioned in its coordinates
+        left, top, right, bottom = area.bounds()
+        for chunk, chunk_left, chunk_top in self._chunks_in(left, top, right, bottom, wait=False):
+            local = Rect(left - chunk_left, top - chunk_top, right - left, bottom - top)
+            for x, y, monster in chunk.monsters_in(local):
+                yield x + chunk_left, y + chunk_top, monster
+
+    def object_types_in(self, area: Rect) -> Iterator[tuple]:
+        left, top, right, bottom = area.bounds()
+        for chunk, chunk_left, chunk_top in self._chunks_in(left, top, right, bottom, wait=False):
+            local = Rect(left - chunk_left, top - chunk_top, right - left, bottom - top)
+            for x, y, type_id in chunk.object_types_in(local):
+                yield x + chunk_left, y + chunk_top, type_id
+
+    def monster_types_in(self, area: Rect) -> Iterator[tuple]:
+        left, top, right, bottom = area.bounds()
+        for chunk, chunk_left, chunk_top in self._chunks_in(left, top, right, bottom, wait=False):
+            local = Rect(left - chunk_left, top - chunk_top, right - left, bottom - top)
+            for x, y, type_id in chunk.monster_types_in(local):
+                yield x + chunk_left, y + chunk_top, type_id
+
+    def objects_at(self, x: int, y: int) -> list:
+        size = self._chunk_size
+        return self._chunk(x // size, y // size).objects_at(x % size, y % size)
+
+    def monsters_at(self, x: int, y: int) -> list:
+        size = self._chunk_size
+        return self._chunk(x // size, y // size).monsters_at(x % size, y % size)